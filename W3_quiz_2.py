@@ -10,20 +10,28 @@
 
 #implicit euler scheme formula
 # s(j+1) = s(j)/(1 + 10*delta_t)
+# For the general solvers (backward Euler, BDF2, Rosenbrock) applied to
+# arbitrary nonlinear right-hand sides, see implicitSolvers.py.
 import numpy as np
 
 def euler_integration(delta_t,n,method):
-    s = [1.]
+    s = 1.
     if method == 'explicit':
         for i in range(1,n+1):
-            res = s[i-1]*(1 - 10*delta_t)
-            s.append(res)
-        return s[n]
+            s = s*(1 - 10*delta_t)
+        return s
     elif method == 'implicit':
         for i in range(1,n+1):
-            res = s[i-1]/(1 + 10*delta_t)
-            s.append(res)
-        return s[n]
+            s = s/(1 + 10*delta_t)
+        return s
+    else:
+        from implicitSolvers import Decay, BackwardEuler, BDF2, Rosenbrock
+        schemes = {'bdf2': BDF2, 'rosenbrock': Rosenbrock, 'backward_euler': BackwardEuler}
+        solver = schemes[method](Decay(10.))
+        x = np.array([s])
+        for i in range(n):
+            x = solver.iterate(x,i*delta_t,delta_t)
+        return x[0]
     
 #ques_1
 #print(euler_integration(0.05,4,'explicit'))
@@ -1,6 +1,9 @@
 from __future__ import print_function, division #compatibility py2 - py3
 import random, math, numpy
 import matplotlib.pyplot as plt
+from chemo_field import GridField
+from cell_list import CellList
+from profiling import timers_or_none
 
 V = 2e-6
 DT = 0.2
@@ -10,20 +13,31 @@ P2 = 0.5
 N = 10
 
 def get_density(x,y): #version A
-    return 1./(1.+math.hypot(x-L/2.,y-L/2.))
+    # Works on scalars as well as on arrays of positions.
+    return 1./(1.+numpy.hypot(x-L/2.,y-L/2.))
 
 ##def get_density(x,y): #version B
-##    return float(math.hypot(x-L/2.,y-L/2.) < 15e-6)
+##    return (numpy.hypot(x-L/2.,y-L/2.) < 15e-6).astype(float)
 
 
-def draw(b_list, n, t):
-    m = numpy.zeros((n,n))
-    for x in range(n):
-        for y in range(n):
-            m[x,y] = get_density(x*L/n,y*L/n)
-    for bacteria in b_list:
-        x,y = bacteria.x*n/L, bacteria.y*n/L
-        m[x,y] = 1.
+# Density maps used by draw(), computed once per resolution n.
+density_grids = {}
+
+def draw(b_list, n, t, field=None):
+    # The map shows the given field, by default get_density sampled on the
+    # n x n grid (the pixel (x,y) is at x*L/n, y*L/n).
+    if field is None:
+        if n not in density_grids:
+            density_grids[n] = GridField.from_function(get_density, n, L)
+        field = density_grids[n]
+    m = field.values.copy()
+    n = field.n
+    if isinstance(b_list, Population):
+        xs, ys = b_list.x, b_list.y
+    else:
+        xs = numpy.array([bacteria.x for bacteria in b_list])
+        ys = numpy.array([bacteria.y for bacteria in b_list])
+    m[(xs*n/L).astype(int) % n, (ys*n/L).astype(int) % n] = 1.
     plt.imshow(m) #add interpolation='None' for non-smoothed image
     plt.savefig("bacteria"+str(t)+".png")
 ##    plt.show() #directly show the image
@@ -65,10 +79,72 @@ class Bacteria(object):
         self.y %= L
         self.old_density = current_density
 
-b_list = [Bacteria(random.random()*L, random.random()*L) for i in range(N)]
+class Population(object):
+# Struct-of-arrays version of a list of Bacteria: the positions, velocities
+# and old densities of all the bacteria are stored in arrays and updated
+# together with the same run-and-tumble rules (P1, P2, V, DT) as Bacteria.
+
+    def __init__(self, n, field=None):
+        # field: optional chemo_field.GridField or DiffusingField answering
+        # the density lookups, and updated with the bacteria at each step.
+        self.field = field
+        self.x = numpy.random.random(n)*L
+        self.y = numpy.random.random(n)*L
+        self.vx = numpy.empty(n)
+        self.vy = numpy.empty(n)
+        self.randomize_velocity(numpy.ones(n, dtype=bool))
+        self.old_density = self.density()
+
+    def __len__(self):
+        return self.x.size
+
+    def randomize_velocity(self, tumble):
+        # New random directions for the bacteria where tumble is True.
+        alpha = numpy.random.random(numpy.count_nonzero(tumble))*math.pi*2
+        self.vx[tumble] = numpy.cos(alpha) * V
+        self.vy[tumble] = numpy.sin(alpha) * V
+
+    def neighbour_counts(self, radius):
+        # Number of other bacteria closer than radius, for each bacterium,
+        # from a cell list rebuilt at the current positions: O(N) for crowding,
+        # quorum sensing or collision rules instead of a loop over all pairs.
+        return CellList(L, radius).build(self.x, self.y).neighbour_counts()
+
+    def density(self):
+        if self.field is None:
+            return get_density(self.x, self.y)
+        return self.field(self.x, self.y)
+
+    def update(self):
+        current_density = self.density()
+        # Probability to go forward: P1 when the density increases, P2 otherwise.
+        p_forward = numpy.where(current_density > self.old_density, P1, P2)
+        go_forward = numpy.random.random(len(self)) < p_forward
+        self.randomize_velocity(~go_forward)
+        self.x += self.vx * DT
+        self.y += self.vy * DT
+        #domain periodicity:
+        self.x %= L
+        self.y %= L
+        self.old_density = current_density
+        if self.field is not None:
+            self.field.update(self.x, self.y, DT)
+
+def run(N=N, steps=200, draw_every=40, plot=True, field=None, timers=None):
+    # Population(N) can hold millions of bacteria; [Bacteria(...) for i in
+    # range(N)] is the equivalent, object-per-bacterium version.
+    # For a nutrient which diffuses and is consumed by the bacteria, use e.g.
+    # field=DiffusingField(GridField.from_function(get_density, 100, L).values, L, 1e-11, 0.05)
+    timers = timers_or_none(timers)
+    b_list = Population(N, field)
+
+    for t in range(steps):
+        if plot and t%draw_every == 0:
+            with timers.phase('draw'):
+                draw(b_list, 100, t, b_list.field)
+        with timers.phase('update'):
+            b_list.update()
+    return b_list
 
-for t in range(200):
-    if t%40 == 0:
-        draw(b_list, 100, t)
-    for bacteria in b_list:
-        bacteria.update()
\ No newline at end of file
+if __name__ == '__main__':
+    run()
@@ -26,11 +26,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from copy import deepcopy
-from numpy import array
+from numpy import array, maximum, fill_diagonal, inf
 from numpy.linalg import norm
 from numpy import random
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from symplectic import SymplecticEuler, Leapfrog, Yoshida4, InvariantMonitor
+from profiling import timers_or_none
+from periodic import PeriodicBox
+from particle_mesh import ParticleMesh
 
 class Node:
 # A node represents a body if it is an endnote (i.e. if node.child is None)
@@ -54,22 +58,36 @@ class Node:
     # Physical position of node, independent of currently active quadrant.
         return self.m_pos / self.m
 
-    def reset_to_0th_quadrant(self):
-    # Re-positions the node to the level-0 quadrant (full domain).
-        # Side-length of the level-0 quadrant is 1.
-        self.s = 1.0
-        # Relative position inside the quadrant is equal to physical position.
-        self.relpos = self.pos().copy()
+    def reset_to_0th_quadrant(self, origin=None, size=1.0):
+    # Re-positions the node to the level-0 quadrant (full domain). By default
+    # the domain is the unit square; otherwise it is the square of side-length
+    # size with lower corner origin (see bounding_box).
+        self.s = size
+        if origin is None:
+            # Relative position inside the quadrant is equal to physical position.
+            self.relpos = self.pos().copy()
+        else:
+            self.relpos = (self.pos() - origin) / size
 
-    def dist(self, other):
-    # Distance between present node and another node.
+    def dist(self, other, box=None):
+    # Distance between present node and another node, or between the nearest
+    # of their periodic images in a periodic.PeriodicBox box.
+        if box is not None:
+            return norm(box.min_image(other.pos() - self.pos()))
         return norm(other.pos() - self.pos())
 
-    def force_on(self, other):
+    def force_on(self, other, box=None):
     # Force which the present node is exerting on a given body.
         # To avoid numerical instabilities, introduce a short-distance cutoff.
         cutoff_dist = 0.002
-        d = self.dist(other)
+        d = self.dist(other, box)
+        if box is not None:
+            # Nearest image, plus the correction for all the other images.
+            r = box.min_image(self.pos() - other.pos())
+            force = box.correction(r) * (self.m*other.m)
+            if d >= cutoff_dist:
+                force += r * (self.m*other.m / d**3)
+            return force
         if d < cutoff_dist:
             return array([0., 0.])
         else:
@@ -88,13 +106,18 @@ class Node:
         return quadrant
 
 
-def add(body, node):
+def add(body, node, smallest_quadrant=1.e-4):
 # Barnes-Hut algorithm: Creation of the quad-tree. This function adds
 # a new body into a quad-tree node. Returns an updated version of the node.
     # 1. If node n does not contain a body, put the new body b here.
     new_node = body if node is None else None
     # To limit the recursion depth, set a lower limit for the size of quadrant.
-    smallest_quadrant = 1.e-4
+    # Bodies meeting in a quadrant smaller than this limit are merged into a
+    # single external node, so that no mass is lost from the tree.
+    if node is not None and node.s <= smallest_quadrant:
+        new_node = deepcopy(node)
+        new_node.m += body.m
+        new_node.m_pos += body.m_pos
     if node is not None and node.s > smallest_quadrant:
         # 3. If node n is an external node, then the new body b is in conflict
         #    with a body already present in this region. ...
@@ -116,11 +139,12 @@ def add(body, node):
         new_node.m_pos += body.m_pos
         # ... and recursively add the new body into the appropriate quadrant.
         quadrant = body.into_next_quadrant()
-        new_node.child[quadrant] = add(body, new_node.child[quadrant])
+        new_node.child[quadrant] = add(body, new_node.child[quadrant],
+                                       smallest_quadrant)
     return new_node
 
 
-def force_on(body, node, theta):
+def force_on(body, node, theta, box=None):
 # Barnes-Hut algorithm: usage of the quad-tree. This function computes
 # the net force on a body exerted by all bodies in node "node".
 # Note how the code is shorter and more expressive than the human-language
@@ -128,25 +152,132 @@ def force_on(body, node, theta):
     # 1. If the current node is an external node, 
     #    calculate the force exerted by the current node on b.
     if node.child is None:
-        return node.force_on(body)
+        return node.force_on(body, box)
 
     # 2. Otherwise, calculate the ratio s/d. If s/d < θ, treat this internal
     #    node as a single body, and calculate the force it exerts on body b.
-    if node.s < node.dist(body) * theta:
-        return node.force_on(body)
+    if node.s < node.dist(body, box) * theta:
+        return node.force_on(body, box)
 
     # 3. Otherwise, run the procedure recursively on each child.
-    return sum(force_on(body, c, theta) for c in node.child if c is not None)
+    return sum(force_on(body, c, theta, box) for c in node.child if c is not None)
+
+
+def bounding_box(bodies):
+# Lower corner and side-length of the smallest square (cube) containing all
+# the bodies, slightly enlarged so that they lie strictly inside. Used as
+# level-0 quadrant, it lets the bodies move freely in an open domain.
+    pos = array([b.pos() for b in bodies])
+    lower = pos.min(axis=0)
+    size = (pos.max(axis=0) - lower).max()
+    size = size * (1 + 1.e-9) if size > 0 else 1.0
+    return lower, size
 
 
 def verlet(bodies, root, theta, G, dt):
-# Execute a time iteration according to the Verlet algorithm.
+# Execute a time iteration according to the Verlet algorithm. Strictly
+# speaking, this is the symplectic Euler scheme (kick, then drift), which is
+# also available as symplectic.SymplecticEuler(BarnesHut(theta, G)).
     for body in bodies:
         force = G * force_on(body, root, theta)
         body.momentum += dt * force
         body.m_pos += dt * body.momentum 
 
 
+class BarnesHut:
+# Separable N-body system for the splitting schemes of symplectic.py: the
+# state is the list of bodies, updated in place by the sub-flows.
+
+    def __init__(self, theta, G, timers=None, domain=None):
+        self.theta = theta
+        self.G = G
+        self.timers = timers_or_none(timers)
+        # domain: None for the unit square, 'open' for a level-0 quadrant
+        # following the bounding box of the bodies, or a periodic.PeriodicBox.
+        self.domain = domain
+        self.box = domain if isinstance(domain, PeriodicBox) else None
+        # Forces at the current positions, valid until the next drift. The
+        # last kick of a leapfrog step and the first kick of the next one are
+        # done at the same positions, so the tree is built once per step.
+        self.forces = None
+
+    def compute_forces(self, bodies):
+        with self.timers.phase('tree build'):
+            if self.box is not None:
+                origin, size = 0. * bodies[0].pos(), self.box.L
+            elif self.domain == 'open':
+                origin, size = bounding_box(bodies)
+            else:
+                origin, size = None, 1.0
+            # Bodies closer than 1e-4 of the level-0 quadrant are merged.
+            root = None
+            for body in bodies:
+                body.reset_to_0th_quadrant(origin, size)
+                root = add(body, root, 1.e-4 * size)
+        with self.timers.phase('force'):
+            return [self.G * force_on(body, root, self.theta, self.box)
+                    for body in bodies]
+
+    def kick(self, bodies, h):
+        if self.forces is None:
+            self.forces = self.compute_forces(bodies)
+        with self.timers.phase('kick'):
+            for body, force in zip(bodies, self.forces):
+                body.momentum += h * force
+        return bodies
+
+    def drift(self, bodies, h):
+        with self.timers.phase('drift'):
+            for body in bodies:
+                body.m_pos += h * body.momentum
+                if self.box is not None:
+                    body.m_pos = body.m * self.box.wrap(body.pos())
+        self.forces = None
+        return bodies
+
+
+class ParticleMeshGravity(BarnesHut):
+# Same sub-flows as BarnesHut, with the forces of the particle-mesh solver pm
+# (a particle_mesh.ParticleMesh, with P3M correction or not) instead of the
+# tree. In a periodic domain the mesh covers the box; otherwise it covers the
+# bounding box of the bodies, with a margin of one cell, at each step.
+
+    def __init__(self, pm, G, timers=None, domain=None):
+        BarnesHut.__init__(self, None, G, timers, domain)
+        if pm.periodic != (self.box is not None):
+            raise ValueError("the mesh and the domain must both be periodic or not")
+        self.pm = pm
+
+    def compute_forces(self, bodies):
+        with self.timers.phase('mesh force'):
+            pos, m = array([b.pos() for b in bodies]), array([b.m for b in bodies])
+            if self.box is not None:
+                origin, h = 0., self.box.L / self.pm.n
+            else:
+                lower, size = bounding_box(bodies)
+                h = size / (self.pm.n - 2)
+                origin = lower - h
+            return list(self.G * self.pm.forces(pos, m, origin, h))
+
+
+def energy(bodies, G):
+# Total energy of the bodies, kinetic plus potential, computed by direct
+# summation. Below the cutoff distance of Node.force_on the force vanishes,
+# so the pair potential is constant there. The periodic images are not
+# counted: in a periodic domain this is not the energy of the dynamics,
+# and run does not monitor it.
+    cutoff_dist = 0.002
+    m = array([b.m for b in bodies])
+    pos = array([b.pos() for b in bodies])
+    mom = array([b.momentum for b in bodies])
+    kinetic = 0.5 * (mom**2).sum(axis=1).dot(1. / m)
+    d = norm(pos[:, None, :] - pos[None, :, :], axis=2)
+    d = maximum(d, cutoff_dist)
+    fill_diagonal(d, inf)
+    potential = -0.5 * G * (m[:, None] * m[None, :] / d).sum()
+    return kinetic + potential
+
+
 def plot_bodies(bodies, i):
 # Write an image representing the current position of the bodies.
 # To create a movie with avconv or ffmpeg use the following command:
@@ -180,37 +311,79 @@ numbodies = 1000
 max_iter = 10000
 # Frequency at which PNG images are written.
 img_iter = 20
+# Time integration scheme of symplectic.py. SymplecticEuler is the scheme of
+# the verlet function (except that all forces are computed before the bodies
+# move); Leapfrog, which also builds one tree per step, or Yoshida4 are of
+# higher order and conserve the energy better at a given time step.
+scheme = 'SymplecticEuler'
+schemes = {'SymplecticEuler': SymplecticEuler, 'Leapfrog': Leapfrog,
+           'Yoshida4': Yoshida4}
+# Force solver: 'tree' (Barnes-Hut), 'pm' (particle mesh of mesh_size cells
+# per direction, cheap for dense bodies but blind below a few cells) or 'p3m'
+# (particle mesh with exact short-range forces); see particle_mesh.py.
+solver = 'tree'
+mesh_size = 128
+
+def initial_bodies(numbodies=numbodies, mass=mass, ini_radius=ini_radius,
+                   inivel=inivel):
+    # The pseudo-random number generator is initialized at a deterministic # value, for proper validation of the output for the exercise series.  random.seed(1)
+    # x- and y-pos are initialized to a square with side-length 2*ini_radius.
+    random.seed(1)
+    posx = random.random(numbodies) *2.*ini_radius + 0.5-ini_radius
+    posy = random.random(numbodies) *2.*ini_radius + 0.5-ini_radius
+    # We only keep the bodies inside a circle of radius ini_radius.
+    bodies = [ Node(mass, px, py) for (px,py) in zip(posx, posy) \
+                   if (px-0.5)**2 + (py-0.5)**2 < ini_radius**2 ]
 
-# The pseudo-random number generator is initialized at a deterministic # value, for proper validation of the output for the exercise series.  random.seed(1)
-# x- and y-pos are initialized to a square with side-length 2*ini_radius.
-random.seed(1)
-posx = random.random(numbodies) *2.*ini_radius + 0.5-ini_radius
-posy = random.random(numbodies) *2.*ini_radius + 0.5-ini_radius
-# We only keep the bodies inside a circle of radius ini_radius.
-bodies = [ Node(mass, px, py) for (px,py) in zip(posx, posy) \
-               if (px-0.5)**2 + (py-0.5)**2 < ini_radius**2 ]
-
-#input("Press the <ENTER> key to continue...")
-#print ("here")
-# Initially, the bodies have a radial velocity of an amplitude proportional to
-# the distance from the center. This induces a rotational motion creating a
-# "galaxy-like" impression.
-for body in bodies:
-    r = body.pos() - array([0.5,0.5])
-    body.momentum = array([-r[1], r[0]]) * mass*inivel*norm(r)/ini_radius
-
-# Principal loop over time iterations.
-for i in range(max_iter):
-    # The quad-tree is recomputed at each iteration.
-    root = None
+    #input("Press the <ENTER> key to continue...")
+    #print ("here")
+    # Initially, the bodies have a radial velocity of an amplitude proportional to
+    # the distance from the center. This induces a rotational motion creating a
+    # "galaxy-like" impression.
     for body in bodies:
-        body.reset_to_0th_quadrant()
-        root = add(body, root)
-    # Computation of forces, and advancment of bodies.
-    verlet(bodies, root, theta, G, dt)
-    # Output
+        r = body.pos() - array([0.5,0.5])
+        body.momentum = array([-r[1], r[0]]) * mass*inivel*norm(r)/ini_radius
+    return bodies
+
+
+def run(theta=theta, mass=mass, ini_radius=ini_radius, inivel=inivel, G=G,
+        dt=dt, numbodies=numbodies, max_iter=max_iter, img_iter=img_iter,
+        scheme=scheme, domain='unit', box_size=1.0, solver=solver,
+        mesh_size=mesh_size, plot=True, timers=None):
+    # domain: 'unit' (unit square of the original code), 'open' (the tree
+    # follows the bodies wherever they go) or 'periodic' (box of side box_size).
+    timers = timers_or_none(timers)
+    bodies = initial_bodies(numbodies, mass, ini_radius, inivel)
+    if domain == 'periodic':
+        domain = PeriodicBox(box_size, 2)
+    elif domain == 'unit':
+        domain = None
+    if solver == 'tree':
+        system = BarnesHut(theta, G, timers, domain)
+    else:
+        pm = ParticleMesh(mesh_size, 2, periodic=isinstance(domain, PeriodicBox),
+                          p3m=(solver == 'p3m'))
+        system = ParticleMeshGravity(pm, G, timers, domain)
+    integrator = schemes[scheme](system)
+    monitor = None
+    if not isinstance(domain, PeriodicBox):
+        monitor = InvariantMonitor(lambda bodies: energy(bodies, G))
+    # Principal loop over time iterations.
+    for i in range(max_iter):
+        # The quad-tree is recomputed at each iteration by the kicks of the
+        # scheme, then forces are computed and the bodies advanced.
+        bodies = integrator.iterate(bodies, i*dt, dt)
+        # Output
            
-    if i%img_iter==0:
-        print("Writing images at iteration {0}".format(i))
-        plot_bodies(bodies, i//img_iter)
+        if plot and i%img_iter==0:
+            with timers.phase('output'):
+                print("Writing images at iteration {0}".format(i))
+                plot_bodies(bodies, i//img_iter)
+                if monitor is not None:
+                    monitor.record(i*dt, bodies)
+                    print(monitor)
+    return bodies
+
 
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,79 @@
+# Accuracy and cost of the Barnes-Hut forces of barnes_hut.py and
+# barnes_hut_3D.py, against the direct-summation reference of direct_sum.py.
+#
+# Run from the root of the repository with, e.g.:
+#     python -m benchmarks.bhAccuracy --numbodies 1000 --budget 1e-2
+# For each tree variant (dimension, smallest quadrant of add()) and each theta,
+# the table reports the percentiles of the relative force error over the
+# bodies, the fraction of the mass missing from the tree and the build and
+# force times. For each dimension, the fastest setting whose error
+# percentile --percentile is within --budget is then recommended.
+
+import argparse, time
+import numpy as np
+
+import matplotlib
+matplotlib.use('Agg')
+
+import barnes_hut, barnes_hut_3D
+from direct_sum import bodies_arrays, direct_forces
+
+variants = {'2D': barnes_hut, '3D': barnes_hut_3D}
+
+def measure(module, bodies, reference, theta, smallest_quadrant):
+    start = time.perf_counter()
+    root = None
+    for body in bodies:
+        body.reset_to_0th_quadrant()
+        root = module.add(body, root, smallest_quadrant)
+    built = time.perf_counter()
+    forces = np.array([module.force_on(body, root, theta) for body in bodies])
+    done = time.perf_counter()
+    error = (np.linalg.norm(forces-reference, axis=1)
+             / np.maximum(np.linalg.norm(reference, axis=1), 1e-300))
+    missing = 1 - root.m/sum(b.m for b in bodies)
+    return error, missing, built-start, done-built
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Barnes-Hut force accuracy against direct summation.")
+    parser.add_argument('--numbodies', type=int, default=1000)
+    parser.add_argument('--thetas', type=float, nargs='+', default=[0.2, 0.35, 0.5, 0.7, 1.0])
+    parser.add_argument('--smallest', type=float, nargs='+', default=[1e-4, 1e-6],
+                        help="values of the smallest quadrant of add()")
+    parser.add_argument('--variants', nargs='+', default=['2D', '3D'], choices=sorted(variants))
+    parser.add_argument('--budget', type=float, default=1e-2, help="relative force error allowed")
+    parser.add_argument('--percentile', type=float, default=90.)
+    args = parser.parse_args(argv)
+
+    rows = []
+    print("{0:>4} {1:>9} {2:>6} {3:>10} {4:>10} {5:>10} {6:>10} {7:>9} {8:>9}".format(
+          "tree", "smallest", "theta", "err p50", "err p90",
+          "err p{0:g}".format(args.percentile), "missing m", "build[s]", "force[s]"))
+    for name in args.variants:
+        module = variants[name]
+        bodies = module.initial_bodies(numbodies=args.numbodies)
+        pos, m = bodies_arrays(bodies)
+        start = time.perf_counter()
+        reference = direct_forces(pos, m)
+        direct_time = time.perf_counter()-start
+        for smallest in args.smallest:
+            for theta in args.thetas:
+                error, missing, build, force = measure(module, bodies, reference, theta, smallest)
+                p50, p90, pq = np.percentile(error, [50, 90, args.percentile])
+                rows.append((name, smallest, theta, pq, build+force))
+                print("{0:>4} {1:>9.0e} {2:>6.2f} {3:>10.2e} {4:>10.2e} {5:>10.2e} {6:>10.2e} {7:>9.3f} {8:>9.3f}".format(
+                      name, smallest, theta, p50, p90, pq, missing, build, force))
+        print("{0:>4} direct summation of {1} bodies: {2:.3f} s".format(name, len(bodies), direct_time))
+
+    # The 2D and 3D trees solve different problems: one recommendation each.
+    for name in args.variants:
+        within = [row for row in rows if row[0] == name and row[3] <= args.budget]
+        if within:
+            smallest, theta, pq, cost = min(within, key=lambda row: row[4])[1:]
+            print("{0:>4} fastest setting within p{1:g} error {2:g}: smallest quadrant {3:g}, theta {4:g} ({5:.3f} s)".format(
+                  name, args.percentile, args.budget, smallest, theta, cost))
+        else:
+            print("{0:>4} no setting meets the error budget {1:g}".format(name, args.budget))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# Scaling of the cell-list neighbour search of cell_list.py, compared with
+# the all-pairs search, for bacteria in the periodic L x L domain.
+#
+# Run from the root of the repository with:
+#     python -m benchmarks.cellList
+
+import time
+import numpy
+
+from bacteria import L
+from cell_list import CellList
+
+def all_pairs_counts(x, y, cutoff):
+    dx = x[:, None]-x[None, :]
+    dy = y[:, None]-y[None, :]
+    dx -= L*numpy.round(dx/L)
+    dy -= L*numpy.round(dy/L)
+    close = numpy.hypot(dx, dy) < cutoff
+    return close.sum(axis=1)-1
+
+
+if __name__ == '__main__':
+    # The cutoff is chosen so that each bacterium has on average 5 neighbours.
+    mean_neighbours = 5
+    print("{0:>9} {1:>10} {2:>10} {3:>12} {4:>12}".format(
+          "N", "build[s]", "pairs[s]", "agents/s", "all-pairs[s]"))
+    for N in (10**3, 3*10**3, 10**4, 10**5, 10**6):
+        x = numpy.random.random(N)*L
+        y = numpy.random.random(N)*L
+        cutoff = L*numpy.sqrt(mean_neighbours/(numpy.pi*N))
+        cells = CellList(L, cutoff)
+        start = time.perf_counter()
+        cells.build(x, y)
+        built = time.perf_counter()
+        counts = cells.neighbour_counts()
+        done = time.perf_counter()
+        brute = ""
+        if N <= 3*10**3:
+            start_brute = time.perf_counter()
+            assert (all_pairs_counts(x, y, cutoff) == counts).all()
+            brute = "{0:.4f}".format(time.perf_counter()-start_brute)
+        print("{0:>9d} {1:>10.4f} {2:>10.4f} {3:>12.0f} {4:>12}".format(
+              N, built-start, done-built, N/(done-start), brute))
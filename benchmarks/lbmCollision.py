@@ -0,0 +1,72 @@
+# Cost and stability of the collision operators of lbmFlowAroundCylinder.py.
+#
+# Run from the root of the repository with, e.g.:
+#     python -m benchmarks.lbmCollision --Re 1000 2000
+# The first table gives the cost of a full time step with each operator, in
+# million lattice-node updates per second (MLUPS) and as a fraction of the
+# time spent in the collision itself. The second gives, for each Reynolds
+# number, the smallest lattice (height ny, with nx = 7/3 ny as in the
+# original setup) on which the flow stays stable for a given number of
+# convective times D/uLB, D being the diameter of the cylinder.
+
+import argparse, time
+import numpy as np
+
+import lbmFlowAroundCylinder as lbm
+from profiling import PhaseTimers
+
+def cost(collision, nx, ny, steps):
+    obstacle, vel, omega, fin = lbm.setup(nx, ny, lbm.Re, lbm.uLB)
+    lbm.step(fin, vel, obstacle, omega, None, collision)
+    timers = PhaseTimers()
+    start = time.perf_counter()
+    for i in range(steps):
+        lbm.step(fin, vel, obstacle, omega, timers, collision)
+    elapsed = time.perf_counter() - start
+    return nx*ny*steps/elapsed/1e6, timers.as_dict()['collision']['seconds']/elapsed
+
+def stable(collision, Re, ny, uLB, periods):
+# Whether the flow on a lattice of height ny survives the given number of
+# convective times: populations finite and velocities below the lattice
+# speed of sound.
+    nx = 7*ny//3
+    obstacle, vel, omega, fin = lbm.setup(nx, ny, Re, uLB)
+    steps = int(periods*2*(ny//9)/uLB)
+    for i in range(steps):
+        u = lbm.step(fin, vel, obstacle, omega, None, collision)
+        if i % 100 == 0 or i == steps-1:
+            if not (np.isfinite(u).all() and np.abs(u).max() < 1/np.sqrt(3)):
+                return False
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cost and stability of the LBM collision operators.")
+    parser.add_argument('--collisions', nargs='+', default=sorted(lbm.collisions),
+                        choices=sorted(lbm.collisions))
+    parser.add_argument('--size', type=int, nargs=2, default=[420, 180], metavar=('NX', 'NY'),
+                        help="lattice of the cost measurement")
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--Re', type=float, nargs='+', default=[1000.])
+    parser.add_argument('--heights', type=int, nargs='+', default=[27, 36, 45, 63, 90, 135, 180],
+                        help="lattice heights ny tried, in increasing order")
+    parser.add_argument('--uLB', type=float, default=lbm.uLB)
+    parser.add_argument('--periods', type=float, default=10.,
+                        help="convective times D/uLB to survive")
+    args = parser.parse_args(argv)
+
+    nx, ny = args.size
+    print("{0:>12} {1:>8} {2:>10}".format("collision", "MLUPS", "collision"))
+    for name in args.collisions:
+        mlups, fraction = cost(name, nx, ny, args.steps)
+        print("{0:>12} {1:>8.2f} {2:>9.0f}%".format(name, mlups, 100*fraction))
+
+    print("{0:>12} {1:>8} {2:>10}".format("collision", "Re", "min ny"))
+    for Re in args.Re:
+        for name in args.collisions:
+            smallest = next((ny for ny in sorted(args.heights)
+                             if stable(name, Re, ny, args.uLB, args.periods)), None)
+            print("{0:>12} {1:>8g} {2:>10}".format(
+                  name, Re, smallest if smallest is not None else "> {0}".format(max(args.heights))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# Steps per second of the integration backends of odeBackends.py.
+#
+# Run from the root of the repository with:
+#     python -m benchmarks.odeBackends
+
+import time
+import numpy as np
+
+from lotkaVolterra import LotkaVolterra, Logistic, ExplicitEuler, RK2
+from odeBackends import CompiledIntegrator, availableBackends
+
+def stepsPerSecond(scheme, model, x0, N, backend, repeat=3):
+    integrator = CompiledIntegrator(scheme(model), x0, 0., 100., N, backend)
+    integrator.integrate()  # Warm-up, includes the compilation with numba.
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        x = integrator.integrate()
+        best = min(best, time.perf_counter()-start)
+    return (N-1)/best, x
+
+
+if __name__ == '__main__':
+    N = 100000
+    print("{0:>14} {1:>14} {2:>8} {3:>14} {4:>12}".format(
+          "model", "scheme", "backend", "steps/s", "max |diff|"))
+    for model, x0 in ((LotkaVolterra(1, 1, 0.5, 0.5), np.array([2., 4.])),
+                      (Logistic(1., 10.), np.array([0.1]))):
+        for scheme in (ExplicitEuler, RK2):
+            reference = None
+            for backend in reversed(availableBackends()):
+                rate, x = stepsPerSecond(scheme, model, x0, N, backend)
+                if reference is None:
+                    reference = x
+                print("{0:>14} {1:>14} {2:>8} {3:>14.0f} {4:>12.1e}".format(
+                      type(model).__name__, scheme.__name__, backend, rate,
+                      np.max(np.abs(x-reference))))
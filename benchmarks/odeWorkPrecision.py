@@ -0,0 +1,66 @@
+# Work-precision comparison of the fixed-step and adaptive integrators
+# of lotkaVolterra.py on the Lotka--Volterra and Logistic models.
+#
+# Run from the root of the repository with:
+#     python -m benchmarks.odeWorkPrecision
+#
+# The work is the number of evaluations of the right-hand side, the
+# precision the maximum error at the final time.
+
+import time
+import numpy as np
+
+from lotkaVolterra import (LotkaVolterra, Logistic, ExplicitEuler, RK2, RK23, RK45,
+                           Integrator, AdaptiveIntegrator)
+
+# Number of evaluations of the right-hand side per step of the fixed-step schemes.
+stagesPerStep = {ExplicitEuler: 1, RK2: 2}
+
+def fixedStep(scheme, model, x0, tmin, tmax, xRef, resolutions):
+    rows = []
+    for N in resolutions:
+        start = time.perf_counter()
+        x = Integrator(scheme(model), x0, tmin, tmax, N).integrate()
+        elapsed = time.perf_counter() - start
+        rows.append((scheme.__name__, str(N), stagesPerStep[scheme]*(N-1),
+                     np.max(np.abs(x[-1]-xRef)), elapsed))
+    return rows
+
+def adaptive(scheme, model, x0, tmin, tmax, xRef, tolerances):
+    rows = []
+    for rtol in tolerances:
+        integrator = AdaptiveIntegrator(scheme(model), x0, tmin, tmax, rtol=rtol, atol=rtol*1e-3)
+        start = time.perf_counter()
+        t, x = integrator.integrate()
+        elapsed = time.perf_counter() - start
+        rows.append((scheme.__name__, "rtol=%.0e" % rtol, integrator.nfev,
+                     np.max(np.abs(x[-1]-xRef)), elapsed))
+    return rows
+
+def workPrecision(name, model, x0, tmin, tmax, xRef):
+    rows = []
+    for scheme in (ExplicitEuler, RK2):
+        rows += fixedStep(scheme, model, x0, tmin, tmax, xRef, [250, 1000, 4000, 16000])
+    for scheme in (RK23, RK45):
+        rows += adaptive(scheme, model, x0, tmin, tmax, xRef, [1e-3, 1e-5, 1e-7, 1e-9])
+
+    print(name)
+    print("{0:>14} {1:>11} {2:>8} {3:>10} {4:>9}".format("scheme", "setting", "nfev", "error", "time[s]"))
+    for row in rows:
+        print("{0:>14} {1:>11} {2:>8d} {3:>10.2e} {4:>9.4f}".format(*row))
+    print()
+
+
+if __name__ == '__main__':
+    # Lotka--Volterra: the reference is a very tightly converged RK45 solution.
+    model = LotkaVolterra(1, 1, 0.5, 0.5)
+    x0 = np.array([2., 4.])
+    tmin, tmax = 0., 13.
+    t, x = AdaptiveIntegrator(RK45(model), x0, tmin, tmax, rtol=1e-13, atol=1e-15).integrate()
+    workPrecision("Lotka-Volterra", model, x0, tmin, tmax, x[-1])
+
+    # Logistic: the reference is the analytical solution.
+    nu, C = 1., 10.
+    x0 = np.array([0.1])
+    xRef = C/(1+(C/x0-1)*np.exp(-nu*tmax))
+    workPrecision("Logistic", Logistic(nu, C), x0, tmin, tmax, xRef)
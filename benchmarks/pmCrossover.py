@@ -0,0 +1,90 @@
+# Cost and accuracy of the particle-mesh forces of particle_mesh.py, with and
+# without P3M correction, against the Barnes-Hut tree of barnes_hut.py and
+# barnes_hut_3D.py, as the number of bodies grows.
+#
+# Run from the root of the repository with, e.g.:
+#     python -m benchmarks.pmCrossover --numbodies 64 1000 16000
+# The bodies are those of the galaxy of initial_bodies (a dense disk or
+# ball). For each number of bodies the table reports the time of one force
+# evaluation and the median and 90th percentile of the relative force error
+# against direct summation, then the smallest number of bodies from which
+# each mesh solver is faster than the tree and than the (vectorized) direct
+# summation itself.
+
+import argparse, time
+import numpy as np
+
+import matplotlib
+matplotlib.use('Agg')
+
+import barnes_hut, barnes_hut_3D
+from direct_sum import bodies_arrays, direct_forces
+from particle_mesh import ParticleMesh
+
+variants = {'2D': (barnes_hut, 2), '3D': (barnes_hut_3D, 3)}
+
+def timed(system, bodies):
+    start = time.perf_counter()
+    forces = np.array(system.compute_forces(bodies))
+    return forces, time.perf_counter()-start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Particle-mesh against Barnes-Hut forces.")
+    parser.add_argument('--numbodies', type=int, nargs='+', default=[16, 64, 250, 1000, 4000])
+    parser.add_argument('--variants', nargs='+', default=['2D', '3D'], choices=sorted(variants))
+    parser.add_argument('--theta', type=float, default=barnes_hut.theta)
+    parser.add_argument('--mesh2d', type=int, default=barnes_hut.mesh_size)
+    parser.add_argument('--mesh3d', type=int, default=barnes_hut_3D.mesh_size)
+    parser.add_argument('--max-direct', type=int, default=20000,
+                        help="largest number of bodies for the direct-summation errors")
+    args = parser.parse_args(argv)
+
+    print("{0:>4} {1:>7} {2:>6} {3:>10} {4:>10} {5:>10}".format(
+          "dim", "N", "solver", "force[s]", "err p50", "err p90"))
+    for name in args.variants:
+        module, dim = variants[name]
+        mesh = args.mesh2d if dim == 2 else args.mesh3d
+        start = time.perf_counter()
+        solvers = {'tree': module.BarnesHut(args.theta, 1.),
+                   'pm': module.ParticleMeshGravity(ParticleMesh(mesh, dim), 1.),
+                   'p3m': module.ParticleMeshGravity(ParticleMesh(mesh, dim, p3m=True), 1.)}
+        print("{0:>4} setup of the meshes of {1}**{2} cells: {3:.3f} s".format(
+              name, mesh, dim, time.perf_counter()-start))
+        faster = {}
+        for n in args.numbodies:
+            # initial_bodies keeps the bodies of a disk (ball) inside a square
+            # (cube): ask for enough bodies to get about n.
+            bodies = module.initial_bodies(numbodies=int(n*(4/np.pi if dim == 2 else 6/np.pi)))
+            reference = None
+            times = {}
+            if len(bodies) <= args.max_direct:
+                pos, m = bodies_arrays(bodies)
+                start = time.perf_counter()
+                reference = direct_forces(pos, m)
+                times['direct'] = time.perf_counter()-start
+                print("{0:>4} {1:>7} {2:>6} {3:>10.4f}".format(
+                      name, len(bodies), 'direct', times['direct']))
+            for solver, system in solvers.items():
+                forces, times[solver] = timed(system, bodies)
+                p50 = p90 = np.nan
+                if reference is not None:
+                    error = (np.linalg.norm(forces-reference, axis=1)
+                             / np.maximum(np.linalg.norm(reference, axis=1), 1e-300))
+                    p50, p90 = np.percentile(error, [50, 90])
+                print("{0:>4} {1:>7} {2:>6} {3:>10.4f} {4:>10.2e} {5:>10.2e}".format(
+                      name, len(bodies), solver, times[solver], p50, p90))
+            for solver in ('pm', 'p3m'):
+                for other in ('tree', 'direct'):
+                    if other in times and times[solver] < times[other]:
+                        faster.setdefault((solver, other), len(bodies))
+        for solver in ('pm', 'p3m'):
+            for other in ('tree', 'direct'):
+                if (solver, other) in faster:
+                    print("{0:>4} {1} faster than {2} from {3} bodies".format(
+                          name, solver, other, faster[solver, other]))
+                else:
+                    print("{0:>4} {1} not faster than {2} in the range tested".format(
+                          name, solver, other))
+
+if __name__ == '__main__':
+    main()
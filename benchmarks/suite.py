@@ -0,0 +1,180 @@
+# Benchmark suite of the simulation kernels, with regression tracking.
+#
+# Run from the root of the repository with:
+#     python -m benchmarks.suite --output results.json
+#     python -m benchmarks.suite --output new.json --compare results.json
+# Each kernel is timed at several problem sizes (best of --repeat runs) and
+# reported as a rate in its natural unit. The results are stored as JSON,
+# together with the git revision, and --compare flags every kernel whose time
+# grew by more than --threshold with respect to a previous run; the exit
+# status is then 1, so that the suite can gate a change.
+
+import argparse, json, platform, subprocess, sys, time
+import numpy as np
+
+import matplotlib
+matplotlib.use('Agg')
+
+### KERNELS ###################################################
+# Each kernel takes a problem size and returns a function running the timed
+# work once, and the amount of work it does in the unit of the kernel.
+
+def bh_bodies(module, n):
+    np.random.seed(1)
+    pos = np.random.random((n, 2 if module.__name__ == 'barnes_hut' else 3))*0.2 + 0.4
+    return [module.Node(1.0, *p) for p in pos]
+
+def bh_build(bodies, add):
+    root = None
+    for body in bodies:
+        body.reset_to_0th_quadrant()
+        root = add(body, root)
+    return root
+
+def barnes_hut_tree(n):
+    import barnes_hut
+    bodies = bh_bodies(barnes_hut, n)
+    return (lambda: bh_build(bodies, barnes_hut.add)), n
+
+def barnes_hut_force(n):
+    import barnes_hut
+    bodies = bh_bodies(barnes_hut, n)
+    root = bh_build(bodies, barnes_hut.add)
+    def work():
+        for body in bodies:
+            barnes_hut.force_on(body, root, barnes_hut.theta)
+    return work, n
+
+def lbm_step(n, steps=10):
+    import lbmFlowAroundCylinder as lbm
+    nx, ny = n, (n*3)//7
+    obstacle, vel, omega, fin = lbm.setup(nx, ny)
+    def work():
+        for i in range(steps):
+            lbm.step(fin, vel, obstacle, omega)
+    return work, nx*ny*steps/1e6
+
+def parity_update(n, steps=10):
+    from parityRule.parityRule import parityStep
+    image = (np.random.random((n, n)) < 0.5).astype(int)
+    def work():
+        state = image
+        for i in range(steps):
+            state = parityStep(state)
+    return work, n*n*steps
+
+def des_events(n):
+    import trafficLights
+    state, events = trafficLights.run(additionalNumCarInQueue=n, plot=False)
+    return (lambda: trafficLights.run(additionalNumCarInQueue=n, plot=False)), events
+
+def ode_steps(n, backend='numpy'):
+    from lotkaVolterra import LotkaVolterra, RK2
+    from odeBackends import CompiledIntegrator
+    integrator = CompiledIntegrator(RK2(LotkaVolterra(1, 1, 0.5, 0.5)), np.array([2., 4.]),
+                                    0., 100., n, backend)
+    integrator.integrate()
+    return integrator.integrate, n-1
+
+def ode_steps_numba(n):
+    from odeBackends import availableBackends
+    if 'numba' not in availableBackends():
+        return None
+    return ode_steps(n, 'numba')
+
+def bacteria_update(n, steps=5):
+    import bacteria
+    population = bacteria.Population(n)
+    def work():
+        for i in range(steps):
+            population.update()
+    return work, n*steps
+
+# name -> (kernel, unit of the rate, sizes, quick sizes)
+kernels = {
+    'barnes_hut_tree':  (barnes_hut_tree, 'bodies/s', [250, 1000, 4000], [250]),
+    'barnes_hut_force': (barnes_hut_force, 'bodies/s', [250, 1000, 2000], [250]),
+    'lbm_step':         (lbm_step, 'MLUPS', [105, 210, 420], [105]),
+    'parity_update':    (parity_update, 'cells/s', [64, 512, 2048], [64]),
+    'des_events':       (des_events, 'events/s', [1000, 10000, 100000], [1000]),
+    'ode_steps':        (ode_steps, 'steps/s', [1000, 10000, 100000], [1000]),
+    'ode_steps_numba':  (ode_steps_numba, 'steps/s', [10000, 100000, 1000000], [10000]),
+    'bacteria_update':  (bacteria_update, 'agents/s', [10**3, 10**5, 10**6], [10**3]),
+}
+
+### TIMING AND COMPARISON #####################################
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(names, quick=False, repeat=3):
+    results = {}
+    for name in names:
+        kernel, unit, sizes, quick_sizes = kernels[name]
+        for size in (quick_sizes if quick else sizes):
+            prepared = kernel(size)
+            if prepared is None:
+                continue
+            work, amount = prepared
+            best = float('inf')
+            for i in range(repeat):
+                start = time.perf_counter()
+                work()
+                best = min(best, time.perf_counter()-start)
+            key = "{0}[{1}]".format(name, size)
+            results[key] = {'seconds': best, 'rate': amount/best, 'unit': unit}
+            print("{0:<32} {1:>10.4f} s {2:>14.4g} {3}".format(key, best, amount/best, unit))
+            sys.stdout.flush()
+    return results
+
+def compare(results, baseline, threshold):
+    """Returns the keys of the results slower than in the baseline by more
+    than the relative threshold, and prints the comparison."""
+    slower = []
+    print("\n{0:<32} {1:>10} {2:>10} {3:>8}".format("kernel", "before[s]", "after[s]", "change"))
+    for key in sorted(set(results) & set(baseline)):
+        before, after = baseline[key]['seconds'], results[key]['seconds']
+        change = after/before - 1
+        flag = ""
+        if change > threshold:
+            slower.append(key)
+            flag = "  SLOWER"
+        print("{0:<32} {1:>10.4f} {2:>10.4f} {3:>+7.1%}{4}".format(key, before, after, change, flag))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation kernels.")
+    parser.add_argument('kernels', nargs='*',
+                        help="kernels to run among {0} (default: all)".format(", ".join(sorted(kernels))))
+    parser.add_argument('--quick', action='store_true', help="smallest problem size only")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', metavar='FILE', help="write the results as JSON to FILE")
+    parser.add_argument('--compare', metavar='FILE', help="JSON results of a previous run")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative slowdown flagged as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+    unknown = set(args.kernels) - set(kernels)
+    if unknown:
+        parser.error("unknown kernels: " + ", ".join(sorted(unknown)))
+
+    results = run_suite(args.kernels or sorted(kernels), args.quick, args.repeat)
+    report = {'revision': git_revision(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'numpy': np.__version__,
+              'machine': platform.machine(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("Comparison with revision {0}".format(baseline.get('revision')))
+        if compare(results, baseline['results'], args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
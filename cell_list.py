@@ -0,0 +1,71 @@
+# Cell lists for the interactions between agents in a periodic L x L domain.
+#
+# The domain is divided into cells of side at least the interaction cutoff,
+# and the agents are sorted by cell. All the pairs closer than the cutoff are
+# then found by looking only at the agents of the same and neighbouring cells,
+# which costs O(N) for a bounded density instead of O(N**2) for all pairs.
+
+from __future__ import print_function, division #compatibility py2 - py3
+import numpy
+
+# Half of the 3x3 stencil of neighbouring cells: every pair of neighbouring
+# cells is visited once, the cell itself included.
+half_stencil = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+
+class CellList(object):
+
+    def __init__(self, L, cutoff):
+        self.L = L
+        self.cutoff = cutoff
+        self.ncell = max(1, int(L // cutoff))
+        self.side = L/self.ncell
+
+    def build(self, x, y):
+    # Sorts the agents by cell (counting sort via a stable argsort of the
+    # cell numbers); to be called again each time the agents move.
+        n = self.ncell
+        self.x, self.y = x, y
+        self.ix = (x // self.side).astype(int) % n
+        self.iy = (y // self.side).astype(int) % n
+        cell = self.ix*n + self.iy
+        self.order = numpy.argsort(cell, kind='stable')
+        self.counts = numpy.bincount(cell, minlength=n*n)
+        self.starts = numpy.cumsum(self.counts) - self.counts
+        return self
+
+    def _min_image(self, d):
+        return d - self.L*numpy.round(d/self.L)
+
+    def pairs(self):
+    # Returns the arrays (i, j, d) of all the pairs of agents closer than the
+    # cutoff, each pair once, and their (minimum image) distance.
+        n = self.ncell
+        if n < 3:
+            # Too few cells for the stencil to be free of duplicates.
+            i, j = numpy.triu_indices(self.x.size, 1)
+            return self._filter(i, j)
+        ix, iy = self.ix[self.order], self.iy[self.order]
+        result = []
+        for dx, dy in half_stencil:
+            neighbour = ((ix+dx) % n)*n + (iy+dy) % n
+            k = self.counts[neighbour]
+            p = numpy.repeat(numpy.arange(ix.size), k)
+            q = (numpy.repeat(self.starts[neighbour], k) + numpy.arange(p.size)
+                 - numpy.repeat(numpy.cumsum(k) - k, k))
+            if (dx, dy) == (0, 0):
+                keep = q > p
+                p, q = p[keep], q[keep]
+            result.append(self._filter(self.order[p], self.order[q]))
+        return tuple(numpy.concatenate(r) for r in zip(*result))
+
+    def _filter(self, i, j):
+        d = numpy.hypot(self._min_image(self.x[j]-self.x[i]),
+                        self._min_image(self.y[j]-self.y[i]))
+        close = d < self.cutoff
+        return i[close], j[close], d[close]
+
+    def neighbour_counts(self):
+    # Number of neighbours closer than the cutoff, for each agent.
+        i, j, d = self.pairs()
+        size = self.x.size
+        return numpy.bincount(i, minlength=size) + numpy.bincount(j, minlength=size)
@@ -0,0 +1,78 @@
+# Chemoattractant fields for the bacteria simulations of bacteria.py.
+#
+# The density is sampled on an n x n grid covering the periodic L x L domain,
+# node (i,j) being at (i*L/n, j*L/n), and is looked up at arbitrary positions
+# by bilinear interpolation, for all the bacteria at once. A GridField is
+# static; a DiffusingField evolves with diffusion and consumption by the
+# bacteria, updated incrementally at each time step.
+
+from __future__ import print_function, division #compatibility py2 - py3
+import math, numpy
+
+class GridField(object):
+
+    def __init__(self, values, L):
+        self.values = numpy.array(values, dtype=float)
+        self.n = self.values.shape[0]
+        self.L = L
+        self.dx = L/self.n
+
+    @classmethod
+    def from_function(cls, density, n, L):
+    # Samples the function density(x,y), which must accept arrays, on the grid.
+        coords = numpy.arange(n)*L/n
+        return cls(density(coords[:,None], coords[None,:]), L)
+
+    def _cells(self, x, y):
+    # Lower-left grid node of the cell containing each position, and the
+    # relative position inside the cell.
+        fx, fy = (x % self.L)/self.dx, (y % self.L)/self.dx
+        i, j = numpy.floor(fx).astype(int), numpy.floor(fy).astype(int)
+        return i % self.n, j % self.n, fx-i, fy-j
+
+    def __call__(self, x, y):
+    # Bilinear interpolation of the density at the positions (x,y).
+        i, j, tx, ty = self._cells(x, y)
+        ip, jp = (i+1) % self.n, (j+1) % self.n
+        v = self.values
+        return ((1-tx)*((1-ty)*v[i,j] + ty*v[i,jp])
+                + tx*((1-ty)*v[ip,j] + ty*v[ip,jp]))
+
+    def update(self, x, y, dt):
+    # A static field does not change; see DiffusingField.
+        pass
+
+class DiffusingField(GridField):
+# Field obeying d(rho)/dt = D*laplacian(rho) - consumption*b*rho, where b is
+# the number of bacteria per grid node, deposited with bilinear weights.
+# Diffusion uses the explicit 5-point scheme, with as many sub-steps as
+# needed for its stability condition D*dt/dx**2 <= 1/4.
+
+    def __init__(self, values, L, D, consumption):
+        GridField.__init__(self, values, L)
+        self.D = D
+        self.consumption = consumption
+
+    def deposit(self, x, y):
+    # Number of bacteria per grid node, with bilinear (cloud-in-cell) weights.
+        i, j, tx, ty = self._cells(x, y)
+        ip, jp = (i+1) % self.n, (j+1) % self.n
+        n = self.n
+        counts = numpy.zeros(n*n)
+        for a, b, w in ((i, j, (1-tx)*(1-ty)), (i, jp, (1-tx)*ty),
+                        (ip, j, tx*(1-ty)), (ip, jp, tx*ty)):
+            counts += numpy.bincount(a*n+b, weights=w, minlength=n*n)
+        return counts.reshape(n, n)
+
+    def update(self, x, y, dt):
+        # Consumption, integrated exactly so that the density stays positive.
+        if self.consumption:
+            self.values *= numpy.exp(-self.consumption*dt*self.deposit(x, y))
+        # Diffusion.
+        if self.D:
+            substeps = int(math.ceil(dt*self.D/self.dx**2/0.25))
+            c = self.D*(dt/substeps)/self.dx**2
+            v = self.values
+            for s in range(substeps):
+                v += c*(numpy.roll(v, 1, 0) + numpy.roll(v, -1, 0)
+                        + numpy.roll(v, 1, 1) + numpy.roll(v, -1, 1) - 4*v)
@@ -0,0 +1,109 @@
+# Convergence study of the fixed-step integrators of lotkaVolterra.py.
+#
+# All the (scheme, resolution) pairs are integrated concurrently in a process
+# pool, and every trajectory is cached by (scheme, parameters, N), so that it
+# is computed only once however many times it is used. The reference solution
+# is the Richardson extrapolation of the two finest resolutions, instead of a
+# brute-force run at a much higher resolution, and the observed order of each
+# scheme is fitted from the errors.
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from lotkaVolterra import Integrator
+
+# Trajectories computed so far, shared by all the studies.
+trajectoryCache = {}
+
+def integrateTrajectory(scheme, model, x0, tMin, tMax, N):
+    return Integrator(scheme(model), x0, tMin, tMax, N).integrate()
+
+def nestedResolutions(N0, levels):
+    """Numbers of points N0, 2*N0-1, 4*N0-3, ... such that
+    each time step is half the previous one and the coarse
+    time grids are contained in the finer ones.
+    """
+    return [(N0-1)*2**k+1 for k in range(levels)]
+
+def computeError(x, xRef, ratio):
+    """Vectorized version of computeError of lotkaVolterra.py:
+    sum over the components of the L2 norm in time of the
+    difference with every ratio-th point of the reference.
+    """
+    return np.sum(np.sqrt(np.sum(np.square(x-xRef[::ratio]), axis=0)))/np.size(x, axis=0)
+
+def richardson(xCoarse, xFine, order):
+    """Richardson extrapolation, on the coarse grid, of two
+    solutions of a scheme of the given order, the fine one
+    having a time step ratio times smaller.
+    """
+    ratio = (np.size(xFine, axis=0)-1)//(np.size(xCoarse, axis=0)-1)
+    xFine = xFine[::ratio]
+    return xFine+(xFine-xCoarse)/(ratio**order-1)
+
+def observedOrder(resolutions, errors):
+    """Order p fitted on errors ~ C*dt**p, by least squares in log-log scale."""
+    dt = 1./(np.asarray(resolutions)-1)
+    return np.polyfit(np.log(dt), np.log(errors), 1)[0]
+
+class ConvergenceStudy:
+    """This class defines the convergence study of a set
+    of schemes for a model, an initial condition x0 and
+    a time interval [tMin,tMax]. The schemes are the classes
+    of lotkaVolterra.py and must have an order attribute.
+
+    Attributes:
+        workers   number of processes (None: number of CPUs, 1: sequential)
+    """
+    def __init__(self, model, x0, tMin, tMax, workers=None):
+        self.model = model
+        self.x0 = np.asarray(x0, dtype=float)
+        self.tMin = tMin
+        self.tMax = tMax
+        self.workers = workers
+
+    def key(self, scheme, N):
+        parameters = tuple(sorted((k, np.asarray(v).tobytes()) for k, v in vars(self.model).items()))
+        return (scheme.__name__, type(self.model).__name__, parameters,
+                self.x0.tobytes(), self.tMin, self.tMax, N)
+
+    def compute(self, tasks):
+        # Integrates, concurrently, the (scheme, N) pairs not yet in the cache.
+        tasks = [(s, N) for s, N in dict.fromkeys(tasks) if self.key(s, N) not in trajectoryCache]
+        if self.workers == 1 or len(tasks) <= 1:
+            results = [integrateTrajectory(s, self.model, self.x0, self.tMin, self.tMax, N)
+                       for s, N in tasks]
+        else:
+            with ProcessPoolExecutor(self.workers) as pool:
+                futures = [pool.submit(integrateTrajectory, s, self.model, self.x0,
+                                       self.tMin, self.tMax, N) for s, N in tasks]
+                results = [f.result() for f in futures]
+        for (s, N), x in zip(tasks, results):
+            trajectoryCache[self.key(s, N)] = x
+
+    def trajectory(self, scheme, N):
+        self.compute([(scheme, N)])
+        return trajectoryCache[self.key(scheme, N)]
+
+    def run(self, schemes, resolutions):
+        """Returns, for each scheme, a dictionary with the errors at
+        the given nested resolutions (see nestedResolutions) and the
+        observed order. The errors are measured on the grid of the
+        coarsest resolution, against the Richardson extrapolation of
+        the two finest solutions of the same scheme.
+        """
+        resolutions = sorted(resolutions)
+        self.compute([(s, N) for s in schemes for N in resolutions])
+
+        N0 = resolutions[0]
+        results = {}
+        for s in schemes:
+            xCoarse, xFine = self.trajectory(s, resolutions[-2]), self.trajectory(s, resolutions[-1])
+            xRef = richardson(xCoarse, xFine, s.order)
+            refRatio = (resolutions[-2]-1)//(N0-1)
+            errors = [computeError(self.trajectory(s, N)[::(N-1)//(N0-1)], xRef[::refRatio], 1)
+                      for N in resolutions]
+            results[s] = {'resolutions': np.array(resolutions),
+                          'errors': np.array(errors),
+                          'order': observedOrder(resolutions, errors)}
+        return results
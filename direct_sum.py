@@ -0,0 +1,34 @@
+# Direct-summation reference for the N-body forces of barnes_hut.py and
+# barnes_hut_3D.py: the force on every body is the exact sum over all the other
+# bodies, with the same 1/r**2 law and short-distance cutoff as Node.force_on.
+#
+# The O(N**2) pairwise interactions are computed with NumPy on chunks of target
+# bodies, the chunk size being chosen so that the temporary arrays stay below
+# a memory bound, whatever the number of bodies.
+
+from numpy import array, asarray, einsum, empty, sqrt, zeros
+
+def bodies_arrays(bodies):
+# Positions and masses of a list of Node bodies, as arrays.
+    return array([b.pos() for b in bodies]), array([b.m for b in bodies])
+
+def direct_forces(pos, m, cutoff_dist=0.002, max_bytes=2**26):
+# Force exerted on each body by all the others (without the gravitational
+# constant, like force_on of the tree). pos has shape (N, dim), m shape (N,).
+    pos = asarray(pos, dtype=float)
+    m = asarray(m, dtype=float)
+    n, dim = pos.shape
+    # About (dim+2) temporary arrays of chunk x N doubles per chunk.
+    chunk = max(1, int(max_bytes // (8*n*(dim+2))))
+    forces = empty((n, dim))
+    for start in range(0, n, chunk):
+        stop = min(n, start+chunk)
+        d = pos[None, :, :] - pos[start:stop, None, :]
+        r2 = einsum('ijk,ijk->ij', d, d)
+        # Pairs closer than the cutoff (the body itself included) do not
+        # interact.
+        inv_r3 = zeros(r2.shape)
+        far = r2 >= cutoff_dist**2
+        inv_r3[far] = 1. / (r2[far] * sqrt(r2[far]))
+        forces[start:stop] = einsum('ij,ijk->ik', inv_r3 * m[None, :], d) * m[start:stop, None]
+    return forces
@@ -0,0 +1,182 @@
+# Event traces of the discrete-event simulations (trafficLights.py).
+#
+# Each processed event is recorded as one row: its type code, its time and
+# the change of the state it caused (state delta). The rows are buffered per
+# column and written in blocks, column after column, to a compact binary log:
+#
+#   header:  magic b'DEST', version (uint16), length (uint32) of a JSON
+#            description of the columns (names and types) and of the event
+#            type names
+#   blocks:  number of rows n (uint32), then each column as n packed values
+#
+# A row costs 1 + 8 + 4 + 1 bytes for the traffic lights, and the log can be
+# queried without rerunning the simulation: the state at any time is the sum
+# of the deltas before it. Run as a script to summarize a log:
+#     python eventTrace.py traffic.trace --queue --plot
+
+from __future__ import print_function
+import argparse, json, struct, sys
+from array import array
+import numpy as np
+
+magic = b'DEST'
+version = 1
+
+class TraceWriter:
+    """Buffered writer of an event log. columns is a list of (name, typecode)
+    of the array module, the first two being 'code' and 'time'; types lists
+    the event type names, in the order of their codes.
+    """
+    def __init__(self, file, columns, types, block=65536):
+        self.file = open(file, 'wb') if isinstance(file, str) else file
+        self.columns = columns
+        self.block = block
+        self.buffers = [array(typecode) for name, typecode in columns]
+        # Columns described by their little-endian NumPy types, e.g. '<i4'.
+        dtypes = [np.dtype(typecode).newbyteorder('<').str for name, typecode in columns]
+        description = json.dumps({'columns': [name for name, typecode in columns],
+                                  'dtypes': dtypes, 'types': types}).encode()
+        self.file.write(magic + struct.pack('<HI', version, len(description)) + description)
+    def record(self, *row):
+        """
+        Appends one event, with one value per column
+        """
+        for buffer, value in zip(self.buffers, row):
+            buffer.append(value)
+        if len(self.buffers[0]) >= self.block:
+            self.flush()
+    def flush(self):
+        """
+        Writes the buffered rows as one block
+        """
+        n = len(self.buffers[0])
+        if n == 0:
+            return
+        self.file.write(struct.pack('<I', n))
+        for buffer in self.buffers:
+            if sys.byteorder != 'little':
+                buffer.byteswap()
+            buffer.tofile(self.file)
+            del buffer[:]
+    def close(self):
+        self.flush()
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+def read_trace(file):
+    """
+    Reads a whole log: returns the event type names and a dict of the
+    columns as NumPy arrays
+    """
+    with open(file, 'rb') as f:
+        data = f.read()
+    if data[:4] != magic:
+        raise ValueError("{0} is not an event trace".format(file))
+    file_version, length = struct.unpack_from('<HI', data, 4)
+    if file_version != version:
+        raise ValueError("unsupported event trace version {0}".format(file_version))
+    offset = 10 + length
+    description = json.loads(data[10:offset].decode())
+    columns = description['columns']
+    dtypes = [np.dtype(dtype) for dtype in description['dtypes']]
+    parts = [[] for c in columns]
+    while offset < len(data):
+        n, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        for part, dtype in zip(parts, dtypes):
+            part.append(np.frombuffer(data, dtype, n, offset))
+            offset += n*dtype.itemsize
+    result = dict((name, np.concatenate(part) if part else np.zeros(0, dtype))
+                  for name, part, dtype in zip(columns, parts, dtypes))
+    return description['types'], result
+
+def state_series(trace, column, initial=0):
+    """
+    Rebuilds the time series of a state variable from its deltas: returns
+    the event times and the value after each event
+    """
+    return trace['time'], initial + np.cumsum(trace[column])
+
+def select(types, trace, names=None, tmin=-np.inf, tmax=np.inf):
+    """
+    Rows of the events of the given type names within [tmin, tmax]
+    """
+    keep = (trace['time'] >= tmin) & (trace['time'] <= tmax)
+    if names is not None:
+        keep &= np.isin(trace['code'], [types.index(name) for name in names])
+    return dict((name, column[keep]) for name, column in trace.items())
+
+def time_average(times, values, tmax=None):
+    """
+    Time average of a piecewise-constant series, each value holding until
+    the next event (until tmax for the last one)
+    """
+    if times.size == 0:
+        return 0.
+    tmax = times[-1] if tmax is None else tmax
+    durations = np.diff(np.append(times, tmax))
+    total = tmax - times[0]
+    return (values*durations).sum()/total if total > 0 else float(values[-1])
+
+def summary(types, trace):
+    if trace['time'].size == 0:
+        return "no events"
+    lines = ["{0} events from t={1:g} to t={2:g}".format(
+             trace['time'].size, trace['time'].min(), trace['time'].max())]
+    counts = np.bincount(trace['code'], minlength=len(types))
+    for name, count in zip(types, counts):
+        lines.append("{0:>8} {1:>10d}".format(name, count))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query an event trace.")
+    parser.add_argument('trace')
+    parser.add_argument('--types', nargs='+', help="event types kept")
+    parser.add_argument('--tmin', type=float, default=-np.inf)
+    parser.add_argument('--tmax', type=float, default=np.inf)
+    parser.add_argument('--queue', action='store_true',
+                        help="queue length after each event (column dcars)")
+    parser.add_argument('--plot', action='store_true')
+    args = parser.parse_args(argv)
+
+    types, trace = read_trace(args.trace)
+    print(summary(types, trace))
+    if args.queue:
+        # The queue length is rebuilt from all the events, and its statistics
+        # are those of all the events in [tmin, tmax] (the value before tmin
+        # holding from tmin on); --types only selects the rows shown.
+        times, cars = state_series(trace, 'dcars')
+        keep = (times >= args.tmin) & (times <= args.tmax)
+        window_times, window_cars = times[keep], cars[keep]
+        before = np.searchsorted(times, args.tmin)
+        if before > 0 and np.isfinite(args.tmin):
+            window_times = np.insert(window_times, 0, args.tmin)
+            window_cars = np.insert(window_cars, 0, cars[before-1])
+        end = min(args.tmax, times[-1]) if times.size else None
+        print("max queue length {0}, time-averaged queue length {1:.3f}".format(
+              window_cars.max() if window_cars.size else 0,
+              time_average(window_times, window_cars, end)))
+        if args.types is not None:
+            keep &= np.isin(trace['code'], [types.index(name) for name in args.types])
+        times, cars = times[keep], cars[keep]
+        if args.plot:
+            import matplotlib.pyplot as plt
+            plt.step(times, cars, where='post')
+            plt.xlabel('time')
+            plt.ylabel('cars waiting')
+            plt.show()
+        else:
+            for t, n in zip(times, cars):
+                print("{0:g} {1}".format(t, n))
+    else:
+        rows = select(types, trace, args.types, args.tmin, args.tmax)
+        columns = [name for name in trace if name not in ('code', 'time')]
+        for i in range(rows['time'].size):
+            print("{0}({1:g}) ".format(types[rows['code'][i]], rows['time'][i])
+                  + " ".join("{0}={1}".format(name, rows[name][i]) for name in columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+
+class Decay:
+    """This class defines the linear test equation
+    ds/dt = -lam*s used in the quiz of week 3.
+    For large lam the equation is stiff.
+
+    Attributes:
+        lam    decay rate
+    """
+    def __init__(self,lam):
+        self.lam = lam
+
+    def __call__(self,x,t):
+        return -self.lam*x
+
+    def jacobian(self,x,t):
+        return -self.lam*np.eye(np.size(x))
+
+class Robertson:
+    """This class defines the chemical kinetics problem
+    of Robertson (1966), a classical stiff test problem:
+    the rates of its three reactions span nine orders of
+    magnitude, and explicit schemes need dt < 2e-4 to stay
+    stable long after the fast transient has died out.
+    """
+    def __call__(self,x,t):
+        r1 = 0.04*x[0]
+        r2 = 1e4*x[1]*x[2]
+        r3 = 3e7*x[1]**2
+        return np.array([-r1+r2, r1-r2-r3, r3])
+
+    def jacobian(self,x,t):
+        return np.array([[-0.04, 1e4*x[2], 1e4*x[1]],
+                         [0.04, -1e4*x[2]-6e7*x[1], -1e4*x[1]],
+                         [0., 6e7*x[1], 0.]])
+
+def numericalJacobian(f,x,t,fx=None):
+    """Forward-difference approximation of the
+    Jacobian matrix df/dx of f at (x,t).
+    """
+    x = np.asarray(x,dtype=float)
+    if fx is None:
+        fx = f(x,t)
+    J = np.empty((np.size(fx),np.size(x)))
+    for j in range(np.size(x)):
+        h = 1e-8*max(1.,abs(x[j]))
+        xh = x.copy()
+        xh[j] += h
+        J[:,j] = (f(xh,t)-fx)/h
+    return J
+
+class ImplicitScheme:
+    """This class contains the linear algebra shared
+    by the implicit schemes: evaluation of the Jacobian of f
+    (analytical if f has a jacobian method, numerical otherwise)
+    and LU factorization of the iteration matrix I - gamma*dt*J.
+    The factorization is cached and reused for as long as the
+    time step does not change and the Newton iterations converge.
+    When they do not, the step is split in two half steps.
+
+    Attributes:
+        tol        relative tolerance of the Newton iterations
+        maxIter    maximum number of Newton iterations per step
+        nJac       number of evaluations of the Jacobian
+        nLU        number of LU factorizations
+        nFailed    number of failed Newton solves
+        nHalved    number of steps split in two half steps
+    """
+    def __init__(self,f,tol=1e-10,maxIter=10):
+        self.f = f
+        self.tol = tol
+        self.maxIter = maxIter
+        self.nJac = 0
+        self.nLU = 0
+        self.nFailed = 0
+        self.nHalved = 0
+        self.J = None
+        self.lu = None
+        self.luKey = None
+
+    def jacobian(self,x,t):
+        self.nJac += 1
+        if hasattr(self.f,'jacobian'):
+            return np.atleast_2d(self.f.jacobian(x,t))
+        return numericalJacobian(self.f,x,t)
+
+    def factorize(self,x,t,h,fresh=False):
+        # h = gamma*dt is the coefficient of J in the iteration matrix.
+        if self.J is None or fresh:
+            self.J = self.jacobian(x,t)
+            self.luKey = None
+        if self.luKey != h:
+            self.lu = lu_factor(np.eye(len(self.J))-h*self.J)
+            self.luKey = h
+            self.nLU += 1
+        return self.lu
+
+    def newton(self,rhs,x,t,h):
+        # Solves y = rhs + h*f(y,t) from the initial guess x, with simplified
+        # Newton iterations (cached Jacobian) first, then, if they diverge or
+        # stop contracting, with full Newton iterations (Jacobian evaluated
+        # at each iterate) restarted from x. Returns None if both fail.
+        for full in (False,True):
+            lu = self.factorize(x,t,h,full)
+            y = np.array(x,dtype=float)
+            previous = np.inf
+            for i in range(self.maxIter):
+                if full and i > 0:
+                    lu = self.factorize(y,t,h,True)
+                with np.errstate(all='ignore'):
+                    residual = rhs+h*self.f(y,t)-y
+                if not np.all(np.isfinite(residual)):
+                    break
+                delta = lu_solve(lu,residual)
+                size = np.linalg.norm(delta)
+                if not size < previous:
+                    break
+                y += delta
+                if size <= self.tol*(1+np.linalg.norm(y)):
+                    return y
+                previous = size
+        # The Jacobian was taken at a rejected iterate: start afresh.
+        self.J = None
+        self.nFailed += 1
+        return None
+
+    def halve(self,x0,t,dt):
+        # Replaces a step whose Newton iterations failed by two half steps.
+        if dt <= 10*np.spacing(max(1.,abs(t))):
+            raise RuntimeError("Newton iterations did not converge at t = "+str(t))
+        self.nHalved += 1
+        x = self.iterate(x0,t,dt/2)
+        return self.iterate(x,t+dt/2,dt/2)
+
+class BackwardEuler(ImplicitScheme):
+    """This class defines the implicit (backward) Euler
+    scheme for the numerical resolution of a differential
+    equation: x1 = x0 + dt*f(x1,t+dt).
+    """
+    def iterate(self,x0,t,dt):
+        x0 = np.atleast_1d(x0)
+        x1 = self.newton(x0,x0,t+dt,dt)
+        return x1 if x1 is not None else self.halve(x0,t,dt)
+
+class BDF2(ImplicitScheme):
+    """This class defines the backward differentiation
+    formula of order 2 with a constant time step:
+    x2 = 4/3*x1 - 1/3*x0 + 2/3*dt*f(x2,t+dt).
+    The scheme remembers the previous step; it starts
+    (and restarts whenever x0 is not the result of the
+    previous call or dt changes) with a backward Euler step.
+    A step split in two half steps is remembered as a whole.
+    """
+    def __init__(self,f,tol=1e-10,maxIter=10):
+        ImplicitScheme.__init__(self,f,tol,maxIter)
+        self.history = None
+
+    def iterate(self,x0,t,dt):
+        x0 = np.atleast_1d(x0)
+        if (self.history is not None and self.history[2] == dt
+                and np.array_equal(self.history[1],x0)):
+            x1 = self.newton(4/3*x0-1/3*self.history[0],x0,t+dt,2/3*dt)
+        else:
+            x1 = self.newton(x0,x0,t+dt,dt)
+        if x1 is None:
+            x1 = self.halve(x0,t,dt)
+        self.history = (x0,x1,dt)
+        return x1
+
+class Rosenbrock(ImplicitScheme):
+    """This class defines the linearly implicit
+    Rosenbrock scheme ROS2 of order 2 (Verwer et al., 1999),
+    which is L-stable and needs no Newton iterations: two
+    linear systems with the same matrix I - gamma*dt*J are
+    solved per step. Since ROS2 keeps its order with an
+    approximate Jacobian, J can be reused for jacobianAge steps.
+    """
+    gamma = 1+1/np.sqrt(2)
+
+    def __init__(self,f,jacobianAge=1):
+        ImplicitScheme.__init__(self,f)
+        self.jacobianAge = jacobianAge
+        self.steps = 0
+
+    def iterate(self,x0,t,dt):
+        x0 = np.atleast_1d(x0)
+        lu = self.factorize(x0,t,self.gamma*dt,self.steps%self.jacobianAge == 0)
+        self.steps += 1
+        k1 = lu_solve(lu,self.f(x0,t))
+        k2 = lu_solve(lu,self.f(x0+dt*k1,t+dt)-2*k1)
+        return x0+dt*(1.5*k1+0.5*k2)
+
+
+if __name__ == '__main__':
+    from lotkaVolterra import RK2
+    # Stiff decay ds/dt = -1000 s integrated with large steps: explicit Euler
+    # is unstable for dt > 2/1000, the implicit schemes are not.
+    dt = 0.01
+    for scheme in (BackwardEuler, BDF2, Rosenbrock):
+        solver = scheme(Decay(1000.))
+        x = np.array([1.])
+        for i in range(100):
+            x = solver.iterate(x,i*dt,dt)
+        print(scheme.__name__, "s(1) =", x[0], "LU factorizations:", solver.nLU)
+    print("ExplicitEuler s(1) =", (1-1000.*dt)**100)
+
+    # Robertson problem up to t = 40 (reference y1 = 0.7158271, Hairer and
+    # Wanner): the implicit schemes take steps of 0.1, 500 times the
+    # stability limit of the explicit schemes.
+    dt = 0.1
+    for scheme in (BackwardEuler, BDF2, RK2):
+        solver = scheme(Robertson())
+        x = np.array([1.,0.,0.])
+        with np.errstate(all='ignore'):
+            for i in range(400):
+                x = solver.iterate(x,i*dt,dt)
+        print(scheme.__name__, "y(40) =", x, "halved steps:", getattr(solver,'nHalved',0))
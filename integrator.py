@@ -1,23 +1,45 @@
-
-
 import numpy as np
 import math
+from quadrature import gaussLegendre, gaussKronrod, romberg
+
+def integrand(x):
+    return np.power(x,2)*np.sin(x)*np.exp(-1*x)
 
 class Integrator:
-    def __init__(self, xMin, xMax, N):
+    # method is one of
+    #   'riemann'   left Riemann sum over N points
+    #   'gauss'     Gauss-Legendre rule with N nodes
+    #   'kronrod'   adaptive Gauss-Kronrod, to the tolerance tol
+    #   'romberg'   Romberg integration, to the tolerance tol
+    # f is a vectorized integrand, and xMin, xMax can be arrays to
+    # integrate a batch of intervals in one call.
+    def __init__(self, xMin, xMax, N, f=integrand, method='riemann', tol=1e-10):
         ################################
         self.xMin = xMin
         self.xMax = xMax
         self.N = N
+        self.f = f
+        self.method = method
+        self.tol = tol
     
             
     def integrate(self):       
         ##################################
-        delta_x = (self.xMax - self.xMin)/(self.N-1)
-        nums = np.arange(self.N-1)
-        nums = nums*delta_x + self.xMin
-        res = np.power(nums,2)*np.sin(nums)*np.exp(-1*nums)
-        res = np.sum(res)*delta_x
+        if self.method == 'riemann':
+            xMin = np.asarray(self.xMin, dtype=float)[..., None]
+            delta_x = (np.asarray(self.xMax, dtype=float)[..., None] - xMin)/(self.N-1)
+            nums = np.arange(self.N-1)
+            nums = nums*delta_x + xMin
+            res = self.f(nums)
+            res = np.sum(res, axis=-1)*delta_x[..., 0]
+        elif self.method == 'gauss':
+            res = gaussLegendre(self.f, self.xMin, self.xMax, self.N)
+        elif self.method == 'kronrod':
+            res = gaussKronrod(self.f, self.xMin, self.xMax, self.tol)
+        elif self.method == 'romberg':
+            res = romberg(self.f, self.xMin, self.xMax, self.tol)
+        else:
+            raise ValueError("Unknown quadrature method: " + self.method)
         self.res = res
         
         
@@ -26,6 +48,13 @@ class Integrator:
         print(self.res)
         
 
-examp = Integrator(1,3,200)
-examp.integrate()
-examp.show()
\ No newline at end of file
+if __name__ == '__main__':
+    examp = Integrator(1,3,200)
+    examp.integrate()
+    examp.show()
+
+    # Same integral with high-order rules: far fewer evaluations of the integrand.
+    for method in ('gauss', 'kronrod', 'romberg'):
+        examp = Integrator(1,3,10,method=method)
+        examp.integrate()
+        examp.show()
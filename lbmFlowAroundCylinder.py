@@ -8,16 +8,14 @@
 from numpy import *
 import matplotlib.pyplot as plt
 from matplotlib import cm
+from profiling import timers_or_none
 
 ###### Flow definition #########################################################
 maxIter = 200000  # Total number of time iterations.
 Re = 150.0         # Reynolds number.
 nx, ny = 420, 180 # Numer of lattice nodes.
-ly = ny-1         # Height of the domain in lattice units.
-cx, cy, r = nx//4, ny//2, ny//9 # Coordinates of the cylinder.
 uLB     = 0.04                  # Velocity in lattice units.
-nulb    = uLB*r/Re;             # Viscoscity in lattice units.
-omega = 1 / (3*nulb+0.5);    # Relaxation parameter.
+collision = 'bgk'  # Collision operator: 'bgk', 'mrt' or 'regularized'.
 
 ###### Lattice Constants #######################################################
 v = array([ [ 1,  1], [ 1,  0], [ 1, -1], [ 0,  1], [ 0,  0],
@@ -31,7 +29,7 @@ col3 = array([6, 7, 8])
 ###### Function Definitions ####################################################
 def macroscopic(fin):
     rho = sum(fin, axis=0)
-    u = zeros((2, nx, ny))
+    u = zeros((2,)+fin.shape[1:])
     for i in range(9):
         u[0,:,:] += v[i,0] * fin[i,:,:]
         u[1,:,:] += v[i,1] * fin[i,:,:]
@@ -40,60 +38,137 @@ def macroscopic(fin):
 
 def equilibrium(rho, u):              # Equilibrium distribution function.
     usqr = 3/2 * (u[0]**2 + u[1]**2)
-    feq = zeros((9,nx,ny))
+    feq = zeros((9,)+u.shape[1:])
     for i in range(9):
         cu = 3 * (v[i,0]*u[0,:,:] + v[i,1]*u[1,:,:])
         feq[i,:,:] = rho*t[i] * (1 + cu + 0.5*cu**2 - usqr)
     return feq
 
-###### Setup: cylindrical obstacle and velocity inlet with perturbation ########
-# Creation of a mask with 1/0 values, defining the shape of the obstacle.
-def obstacle_fun(x, y):
-    return (x-cx)**2+(y-cy)**2<r**2
-
-obstacle = fromfunction(obstacle_fun, (nx,ny))
-
-# Initial velocity profile: almost zero, with a slight perturbation to trigger
-# the instability.
-def inivel(d, x, y):
-    return (1-d) * uLB * (1 + 1e-4*sin(y/ly*2*pi))
+###### Collision operators #####################################################
+# Each operator returns the post-collision populations fout from the
+# populations fin, their equilibrium feq and the relaxation parameter omega,
+# which fixes the viscosity in all cases.
+
+def bgk(fin, feq, omega):             # Single relaxation time (BGK).
+    return fin - omega * (fin - feq)
+
+# Moments of the populations for the multiple-relaxation-time (MRT) operator
+# (Lallemand and Luo 2000): density, energy, energy squared, x-momentum,
+# x-energy flux, y-momentum, y-energy flux and the two stresses.
+c2 = v[:,0]**2 + v[:,1]**2
+M = array([ ones(9), -4 + 3*c2, 4 - 21/2*c2 + 9/2*c2**2,
+            v[:,0], (-5 + 3*c2)*v[:,0], v[:,1], (-5 + 3*c2)*v[:,1],
+            v[:,0]**2 - v[:,1]**2, v[:,0]*v[:,1] ])
+Minv = linalg.inv(M)
+# Relaxation rates of the non-hydrodynamic moments (energy, energy squared,
+# energy fluxes). The stresses relax with omega, and the conserved moments
+# do not relax.
+mrtRates = (1.1, 1.0, 1.2)
+
+def mrt(fin, feq, omega):
+    se, seps, sq = mrtRates
+    S = array([0, se, seps, 0, sq, 0, sq, omega, omega])
+    C = Minv.dot(S[:,newaxis] * M)
+    return fin - tensordot(C, fin - feq, axes=1)
+
+# Tensors Q_i = v_i v_i - 1/3 I of the regularized operator, as (xx, yy, xy).
+Q = array([ v[:,0]**2 - 1/3, v[:,1]**2 - 1/3, v[:,0]*v[:,1] ])
+
+def regularized(fin, feq, omega):
+# The off-equilibrium part is replaced by its projection on the stress
+# (Latt and Chopard 2006), which filters out the non-hydrodynamic modes.
+    fneq = fin - feq
+    pxx = tensordot(v[:,0]**2, fneq, axes=1)
+    pyy = tensordot(v[:,1]**2, fneq, axes=1)
+    pxy = tensordot(v[:,0]*v[:,1], fneq, axes=1)
+    fneq = 9/2 * t[:,newaxis,newaxis] * ( Q[0][:,newaxis,newaxis]*pxx +
+            Q[1][:,newaxis,newaxis]*pyy + 2*Q[2][:,newaxis,newaxis]*pxy )
+    return feq + (1 - omega) * fneq
+
+collisions = {'bgk': bgk, 'mrt': mrt, 'regularized': regularized}
 
-vel = fromfunction(inivel, (2,nx,ny))
-
-# Initialization of the populations at equilibrium with the given velocity.
-fin = equilibrium(1, vel)
+###### Setup: cylindrical obstacle and velocity inlet with perturbation ########
+def setup(nx=nx, ny=ny, Re=Re, uLB=uLB):
+# Returns the obstacle mask, the inlet velocity, the relaxation parameter and
+# the initial populations of a flow of Reynolds number Re on a nx x ny lattice.
+    ly = ny-1         # Height of the domain in lattice units.
+    cx, cy, r = nx//4, ny//2, ny//9 # Coordinates of the cylinder.
+    nulb    = uLB*r/Re;             # Viscoscity in lattice units.
+    omega = 1 / (3*nulb+0.5);    # Relaxation parameter.
+
+    # Creation of a mask with 1/0 values, defining the shape of the obstacle.
+    def obstacle_fun(x, y):
+        return (x-cx)**2+(y-cy)**2<r**2
+
+    obstacle = fromfunction(obstacle_fun, (nx,ny))
+
+    # Initial velocity profile: almost zero, with a slight perturbation to trigger
+    # the instability.
+    def inivel(d, x, y):
+        return (1-d) * uLB * (1 + 1e-4*sin(y/ly*2*pi))
+
+    vel = fromfunction(inivel, (2,nx,ny))
+
+    # Initialization of the populations at equilibrium with the given velocity.
+    fin = equilibrium(1, vel)
+    return obstacle, vel, omega, fin
+
+###### Time step ###############################################################
+def step(fin, vel, obstacle, omega, timers=None, collision=bgk):
+# Executes one time iteration in place on the populations fin, and returns
+# the velocity field. collision is one of the collision operators, or its
+# name in collisions.
+    timers = timers_or_none(timers)
+    collision = collisions.get(collision, collision)
+    with timers.phase('boundaries'):
+        # Right wall: outflow condition.
+        fin[col3,-1,:] = fin[col3,-2,:] 
+
+    with timers.phase('macroscopic'):
+        # Compute macroscopic variables, density and velocity.
+        rho, u = macroscopic(fin)
+
+    with timers.phase('boundaries'):
+        # Left wall: inflow condition.
+        u[:,0,:] = vel[:,0,:]
+        rho[0,:] = 1/(1-u[0,0,:]) * ( sum(fin[col2,0,:], axis=0) +
+                                      2*sum(fin[col3,0,:], axis=0) )
+    with timers.phase('collision'):
+        # Compute equilibrium.
+        feq = equilibrium(rho, u)
+        fin[[0,1,2],0,:] = feq[[0,1,2],0,:] + fin[[8,7,6],0,:] - feq[[8,7,6],0,:]
+
+        # Collision step.
+        fout = collision(fin, feq, omega)
+
+    with timers.phase('bounce-back'):
+        # Bounce-back condition for obstacle.
+        for i in range(9):
+            fout[i, obstacle] = fin[8-i, obstacle]
+
+    with timers.phase('streaming'):
+        # Streaming step.
+        for i in range(9):
+            fin[i,:,:] = roll(
+                                roll(fout[i,:,:], v[i,0], axis=0),
+                                v[i,1], axis=1 )
+    return u
 
 ###### Main time loop ##########################################################
-for time in range(maxIter):
-    # Right wall: outflow condition.
-    fin[col3,-1,:] = fin[col3,-2,:] 
-
-    # Compute macroscopic variables, density and velocity.
-    rho, u = macroscopic(fin)
-
-    # Left wall: inflow condition.
-    u[:,0,:] = vel[:,0,:]
-    rho[0,:] = 1/(1-u[0,0,:]) * ( sum(fin[col2,0,:], axis=0) +
-                                  2*sum(fin[col3,0,:], axis=0) )
-    # Compute equilibrium.
-    feq = equilibrium(rho, u)
-    fin[[0,1,2],0,:] = feq[[0,1,2],0,:] + fin[[8,7,6],0,:] - feq[[8,7,6],0,:]
-
-    # Collision step.
-    fout = fin - omega * (fin - feq)
-
-    # Bounce-back condition for obstacle.
-    for i in range(9):
-        fout[i, obstacle] = fin[8-i, obstacle]
-
-    # Streaming step.
-    for i in range(9):
-        fin[i,:,:] = roll(
-                            roll(fout[i,:,:], v[i,0], axis=0),
-                            v[i,1], axis=1 )
+def run(maxIter=maxIter, Re=Re, nx=nx, ny=ny, uLB=uLB, collision=collision,
+        plot=True, plotIter=100, timers=None):
+    timers = timers_or_none(timers)
+    obstacle, vel, omega, fin = setup(nx, ny, Re, uLB)
+    for time in range(maxIter):
+        u = step(fin, vel, obstacle, omega, timers, collision)
  
-    # Visualization of the velocity.
-    if (time%100==0):
-        plt.clf()
-        plt.imshow(sqrt(u[0]**2+u[1]**2).transpose(), cmap=cm.Reds)
-        plt.savefig("vel.{0:04d}.png".format(time//100))
+        # Visualization of the velocity.
+        if (plot and time%plotIter==0):
+            with timers.phase('output'):
+                plt.clf()
+                plt.imshow(sqrt(u[0]**2+u[1]**2).transpose(), cmap=cm.Reds)
+                plt.savefig("vel.{0:04d}.png".format(time//plotIter))
+    return fin
+
+if __name__ == '__main__':
+    run()
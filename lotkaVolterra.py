@@ -1,6 +1,8 @@
 import numpy as np
 import math
 import matplotlib.pyplot as plt
+from symplectic import Leapfrog, Yoshida4, InvariantMonitor
+from profiling import timers_or_none
 
 class LotkaVolterra:
     """This class defines the Lotka--Voltera prey-predator
@@ -20,12 +22,37 @@ class LotkaVolterra:
         self.k_ac = k_ac
 
     def __call__(self,x,t):
-        y = np.zeros(len(x))
-        y[0] = self.k_a*x[0]-self.k_ca*x[0]*x[1]
-        y[1] = -self.k_c*x[1]+self.k_ac*x[0]*x[1]
+        # x has shape (...,2): a single state or a batch of states. The rates
+        # may be scalars or arrays broadcasting against x[...,0], which allows
+        # to evaluate many parameter sets in one call.
+        y = np.empty(np.shape(x))
+        y[...,0] = self.k_a*x[...,0]-self.k_ca*x[...,0]*x[...,1]
+        y[...,1] = -self.k_c*x[...,1]+self.k_ac*x[...,0]*x[...,1]
 
         return y
 
+    def jacobian(self,x,t):
+        return np.array([[self.k_a-self.k_ca*x[1], -self.k_ca*x[0]],
+                         [self.k_ac*x[1], -self.k_c+self.k_ac*x[0]]])
+
+    def invariant(self,x):
+        # First integral of the system, constant along the exact trajectories.
+        return (self.k_ac*x[...,0]-self.k_c*np.log(x[...,0])
+                +self.k_ca*x[...,1]-self.k_a*np.log(x[...,1]))
+
+    # In the variables (log a, log c) the system is Hamiltonian and separable:
+    # each population evolves exactly while the other one is frozen. These two
+    # sub-flows are the "drift" and "kick" of the schemes of symplectic.py.
+    def drift(self,x,h):
+        y = np.array(x,dtype=float)
+        y[...,0] *= np.exp(h*(self.k_a-self.k_ca*x[...,1]))
+        return y
+
+    def kick(self,x,h):
+        y = np.array(x,dtype=float)
+        y[...,1] *= np.exp(h*(self.k_ac*x[...,0]-self.k_c))
+        return y
+
 class Logistic:
     """This class defines the Logistic population
     growth of a population which has a limited size C
@@ -42,11 +69,16 @@ class Logistic:
     def __call__(self,x,t):
         return self.nu*(1-x/self.C)*x
 
+    def jacobian(self,x,t):
+        return np.diag(self.nu*(1-2*x/self.C))
+
 class ExplicitEuler:
     """This class defines the Explicit Euler 
     scheme for the numerical resolution of 
     a differentiel equation.
     """
+    order = 1
+
     def __init__(self,f):
         self.f = f
 
@@ -58,12 +90,96 @@ class RK2:
     scheme for the numerical resolution of 
     a differentiel equation.
     """
+    order = 2
+
     def __init__(self,f):
         self.f = f
 
     def iterate(self,x0,t,dt):
         return x0+dt*self.f(x0+dt/2*self.f(x0,t),t+dt/2)
 
+class EmbeddedRK:
+    """This class defines an embedded explicit Runge-Kutta
+    scheme given by its Butcher tableau (c,a,b) and by the
+    weights bHat of an embedded solution of lower order.
+    The difference of the two solutions is an estimate of
+    the local error, which is used by the AdaptiveIntegrator.
+    The matrix P of a continuous extension gives the solution
+    inside a step from its stages k:
+    x(t+s*dt) = x0 + dt*sum_j k[j]*(P[j,0]*s + P[j,1]*s**2 + ...).
+
+    Attributes:
+        order   order of the propagated solution
+        nfev    number of evaluations of f done so far
+        k       stages of the last step
+    """
+    c = a = b = bHat = P = None
+    order = None
+
+    def __init__(self,f):
+        self.f = f
+        self.nfev = 0
+
+    def step(self,x0,t,dt,f0=None):
+        # Returns the new solution, the local error estimate and f at the
+        # new point. The last stage of the tableaux below is evaluated at
+        # the new solution ("first same as last"), so that passing it as
+        # f0 saves one evaluation of f at the next step.
+        k = [self.f(x0,t) if f0 is None else f0]
+        for i in range(1,len(self.c)):
+            dx = sum(self.a[i][j]*k[j] for j in range(i) if self.a[i][j] != 0)
+            k.append(self.f(x0+dt*dx,t+self.c[i]*dt))
+        self.nfev += len(self.c) - (f0 is not None)
+        self.k = k
+        x1 = x0+dt*sum(bi*ki for bi,ki in zip(self.b,k) if bi != 0)
+        err = dt*sum((bi-bj)*ki for bi,bj,ki in zip(self.b,self.bHat,k) if bi != bj)
+        return x1,err,k[-1]
+
+    def iterate(self,x0,t,dt):
+        return self.step(x0,t,dt)[0]
+
+class RK23(EmbeddedRK):
+    """This class defines the Bogacki-Shampine
+    scheme of order 3 with an embedded solution of order 2.
+    """
+    order = 3
+    c    = [0, 1/2, 3/4, 1]
+    a    = [[],
+            [1/2],
+            [0, 3/4],
+            [2/9, 1/3, 4/9]]
+    b    = [2/9, 1/3, 4/9, 0]
+    bHat = [7/24, 1/4, 1/3, 1/8]
+    # Cubic Hermite interpolation, of order 3.
+    P    = [[1, -4/3, 5/9],
+            [0, 1, -2/3],
+            [0, 4/3, -8/9],
+            [0, -1, 1]]
+
+class RK45(EmbeddedRK):
+    """This class defines the Dormand-Prince
+    scheme of order 5 with an embedded solution of order 4.
+    """
+    order = 5
+    c    = [0, 1/5, 3/10, 4/5, 8/9, 1, 1]
+    a    = [[],
+            [1/5],
+            [3/40, 9/40],
+            [44/45, -56/15, 32/9],
+            [19372/6561, -25360/2187, 64448/6561, -212/729],
+            [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+            [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+    b    = [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0]
+    bHat = [5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40]
+    # Continuous extension of order 4 (Dormand and Prince 1986, Shampine 1986).
+    P    = [[1, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432],
+            [0, 0, 0, 0],
+            [0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799],
+            [0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072],
+            [0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632],
+            [0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844],
+            [0, 40617522/29380423, -110615467/29380423, 69997945/29380423]]
+
 class Integrator:
     """This class defines the Integration  
     of a differential equation between tMin and tMax
@@ -73,20 +189,150 @@ class Integrator:
         self.x0   = x0
         self.tMin = tMin
         self.tMax = tMax
+        self.N    = N
         self.dt   = (tMax - tMin)/(N-1)
 
         self.f = method
 
     def getIntegrationTime(self):
-        return np.arange(self.tMin,self.tMax+self.dt,self.dt)
-        
+        return np.linspace(self.tMin,self.tMax,self.N)
 
     def integrate(self):
-        x = np.array([self.x0])
-        for t in np.arange(self.tMin,self.tMax,self.dt):
-            x = np.append( x, [self.f.iterate(x[-1,:],t,self.dt)],axis=0)
+        # The solution is preallocated, shape (N,)+shape(x0), and filled
+        # in place instead of being grown by one step at each iteration.
+        x = np.empty((self.N,)+np.shape(self.x0))
+        x[0] = self.x0
+        t = self.getIntegrationTime()
+        for i in range(self.N-1):
+            x[i+1] = self.f.iterate(x[i],t[i],self.dt)
         return x
 
+class BatchIntegrator(Integrator):
+    """This class defines the simultaneous integration
+    of a batch of initial conditions x0 of shape (batch,dim).
+    The rates of the model can be arrays of shape (batch,)
+    so that each trajectory uses its own parameter set.
+    The result has shape (batch,N,dim).
+    """
+    def __init__(self,method,x0,tMin,tMax,N):
+        Integrator.__init__(self,method,np.atleast_2d(x0),tMin,tMax,N)
+
+    def integrate(self):
+        return np.swapaxes(Integrator.integrate(self),0,1)
+
+class AdaptiveIntegrator:
+    """This class defines the Integration of a differential
+    equation between tMin and tMax with an embedded Runge-Kutta
+    method, whose time step is adapted so that the estimated
+    local error stays below atol + rtol*|x|.
+
+    Attributes:
+        nAccepted   number of accepted steps
+        nRejected   number of rejected steps
+        nfev        number of evaluations of the right-hand side
+        status      0 if tMax was reached, -1 if the integration failed
+        message     reason of the failure
+    """
+    def __init__(self,method,x0,tMin,tMax,rtol=1e-6,atol=1e-9,dt0=None):
+        self.x0   = np.asarray(x0,dtype=float)
+        self.tMin = tMin
+        self.tMax = tMax
+        self.rtol = rtol
+        self.atol = atol
+        self.dt0  = dt0
+
+        self.f = method
+
+    def errorNorm(self,err,x0,x1):
+        scale = self.atol+self.rtol*np.maximum(np.abs(x0),np.abs(x1))
+        return math.sqrt(np.mean(np.square(err/scale)))
+
+    def initialStep(self,f0):
+        # Step such that an explicit Euler step changes x by about 1% of
+        # the tolerance-weighted norm of x (Hairer, Norsett and Wanner).
+        d0 = self.errorNorm(self.x0,self.x0,self.x0)
+        d1 = self.errorNorm(f0,self.x0,self.x0)
+        if d0 < 1e-5 or d1 < 1e-5:
+            return 1e-6
+        return min(0.01*d0/d1,self.tMax-self.tMin)
+
+    def integrate(self):
+        self.f.nfev = 0
+        self.nAccepted = 0
+        self.nRejected = 0
+        safety, minFactor, maxFactor = 0.9, 0.2, 5.
+        exponent = -1./self.f.order
+
+        t, x = self.tMin, self.x0
+        f0 = self.f.f(x,t)
+        self.f.nfev += 1
+        dt = self.initialStep(f0) if self.dt0 is None else self.dt0
+        times, states, slopes, stages = [t], [x], [f0], []
+        self.status, self.message = 0, "tMax reached"
+        while t < self.tMax:
+            dt = min(dt,self.tMax-t)
+            # Like solve_ivp, give up when the step becomes negligible in
+            # front of t: the tolerance cannot be met (e.g. a blowup). The
+            # solution is then returned up to the last accepted step.
+            if dt < 10*np.spacing(abs(t)):
+                self.status = -1
+                self.message = "step size below 10*spacing(t) at t={0:g}".format(t)
+                break
+            x1,err,f1 = self.f.step(x,t,dt,f0)
+            errNorm = self.errorNorm(err,x,x1)
+            if not math.isfinite(errNorm):
+                # Non-finite solution or error estimate: reject the step.
+                self.nRejected += 1
+                dt *= minFactor
+                continue
+            if errNorm <= 1.:
+                t, x, f0 = t+dt, x1, f1
+                times.append(t)
+                states.append(x)
+                slopes.append(f0)
+                stages.append(self.f.k)
+                self.nAccepted += 1
+                factor = maxFactor if errNorm == 0 else min(maxFactor,safety*errNorm**exponent)
+            else:
+                self.nRejected += 1
+                factor = max(minFactor,safety*errNorm**exponent)
+            dt *= factor
+        self.nfev = self.f.nfev
+
+        self.t = np.array(times)
+        self.x = np.array(states)
+        self.dxdt = np.array(slopes)
+        self.k = np.array(stages)
+        return self.t, self.x
+
+    def denseOutput(self,t):
+        # Solution at the times t (within [tMin,t[-1]]), of shape
+        # shape(t)+shape(x0), given by the continuous extension of the
+        # method from the stages of the steps: of order 4 for RK45 and 3
+        # for RK23. Methods without one fall back to cubic Hermite
+        # interpolation from the values of f at the ends of the steps.
+        t = np.asarray(t,dtype=float)
+        i = np.clip(np.searchsorted(self.t,t,side='right')-1,0,len(self.t)-2)
+        state = (Ellipsis,)+(None,)*self.x0.ndim
+        h = self.t[i+1]-self.t[i]
+        s = (t-self.t[i])/h
+        if self.f.P is None:
+            s, h = s[state], h[state]
+            return ((1+2*s)*(1-s)**2*self.x[i] + s*(1-s)**2*h*self.dxdt[i]
+                    + s**2*(3-2*s)*self.x[i+1] + s**2*(s-1)*h*self.dxdt[i+1])
+        P = np.array(self.f.P)
+        weights = (s[...,None]**np.arange(1,P.shape[1]+1)).dot(P.T)
+        return self.x[i] + h[state]*(weights[state]*self.k[i]).sum(axis=t.ndim)
+
+def parameterGrid(**rates):
+    """Returns the cartesian product of the given rate values
+    as a dictionary of flat arrays of equal length, ready to be
+    passed to the model, e.g. LotkaVolterra(**parameterGrid(...)).
+    """
+    names = list(rates)
+    grid = np.meshgrid(*[np.atleast_1d(rates[n]) for n in names],indexing='ij')
+    return dict((n,g.ravel()) for n,g in zip(names,grid))
+
 # Plots the data in a 2d plot 
 def plotData(x,y,color,legend):
     plt.rc('text', usetex=True)
@@ -114,26 +360,6 @@ def parametricPlotData(x,y,color,xAxis,yAxis,legend):
     plt.plot(x,y,color,linewidth=2.0,label=legend)
     plt.legend(loc=2,prop={'size':20})
 
-# Plot the population of the antelope and the cheetah
-x0 = np.array([2, 4])
-tmin = 0
-tmax = 100
-
-rk2 = Integrator(RK2(LotkaVolterra(1,1,0.5,0.5)),x0,tmin,tmax,2000)
-eul = Integrator(ExplicitEuler(LotkaVolterra(1,1,0.5,0.5)),x0,tmin,tmax,2000)
-
-plotData(rk2.getIntegrationTime(),rk2.integrate()[:,0],'r-',"antelope (RK)")
-plotData(rk2.getIntegrationTime(),rk2.integrate()[:,1],'b-',"cheetah (RK)")
-plotData(eul.getIntegrationTime(),eul.integrate()[:,0],'g-',"antelope (E)")
-plotData(eul.getIntegrationTime(),eul.integrate()[:,1],'m-',"cheetah (E)")
-
-plt.show()
-
-parametricPlotData(rk2.integrate()[:,0], rk2.integrate()[:,1],'r-','a(t)','c(t)',"6 ini (RK)")
-parametricPlotData(eul.integrate()[:,0], eul.integrate()[:,1],'b-','a(t)','c(t)',"6 ini (E)")
-
-plt.show()
-
 # Compues the errror between 2 solutions with a given ratio 
 # in term of resolution points
 def computeError(x,xRef,ratio):
@@ -145,43 +371,75 @@ def computeError(x,xRef,ratio):
     return totError
 
 
-n_rk = np.array([1000, 2000, 4000, 8000])
-n_e = np.array([1000, 2000, 4000, 8000])
-
-n_ref = 16000
-tmin = 0
-tmax = 13
-
-rk2 = Integrator(RK2(LotkaVolterra(1,1,0.5,0.5)),x0,tmin,tmax,n_ref)
-solRefRK = rk2.integrate()
-
-eul = Integrator(ExplicitEuler(LotkaVolterra(1,1,0.5,0.5)),x0,tmin,tmax,n_ref)
-solRefE = eul.integrate()
-
-
-errRK = []
-for i in n_rk:
-	rk = Integrator(RK2(LotkaVolterra(1,1,0.5,0.5)),x0,tmin,tmax,i)
-	r_rk = n_ref//i
-	errRK.append(computeError(rk.integrate(),solRefRK,r_rk))
-	print(computeError(rk.integrate(),solRefRK,r_rk))
-
-plt.loglog(n_rk,errRK,'ro',linewidth=2.0,label="RK2 error")
-plt.loglog(n_rk,np.power(n_rk/10,-2),'k-',linewidth=2.0,label="-2 slope")
-plt.legend(loc=3)
-plt.show()
-
-errE = []
-for i in n_rk:
-	e = Integrator(ExplicitEuler(LotkaVolterra(1,1,0.5,0.5)),x0,tmin,tmax,i)
-	r_rk = n_ref//i
-	errE.append(computeError(e.integrate(),solRefRK,r_rk))
-	print(computeError(e.integrate(),solRefRK,r_rk))
-
-
-plt.loglog(n_rk,errE,'ro',linewidth=2.0,label="Euler error")
-plt.loglog(n_rk,np.power(n_e/100,-2),'k-',linewidth=2.0,label="-1 slope")
-plt.legend(loc=3)
-plt.show()
-
-
+def run(k_a=1,k_ca=1,k_c=0.5,k_ac=0.5,x0=(2,4),tmax=100,N=2000,plot=True,timers=None):
+    timers = timers_or_none(timers)
+    model = LotkaVolterra(k_a,k_ca,k_c,k_ac)
+
+    # Plot the population of the antelope and the cheetah
+    x0 = np.array(x0)
+    tmin = 0
+
+    rk2 = Integrator(RK2(model),x0,tmin,tmax,N)
+    eul = Integrator(ExplicitEuler(model),x0,tmin,tmax,N)
+
+    # Each trajectory is integrated only once and reused by all the plots.
+    with timers.phase('integration'):
+        solRK = rk2.integrate()
+        solE = eul.integrate()
+
+    if plot:
+        plotData(rk2.getIntegrationTime(),solRK[:,0],'r-',"antelope (RK)")
+        plotData(rk2.getIntegrationTime(),solRK[:,1],'b-',"cheetah (RK)")
+        plotData(eul.getIntegrationTime(),solE[:,0],'g-',"antelope (E)")
+        plotData(eul.getIntegrationTime(),solE[:,1],'m-',"cheetah (E)")
+
+        plt.show()
+
+        parametricPlotData(solRK[:,0], solRK[:,1],'r-','a(t)','c(t)',"6 ini (RK)")
+        parametricPlotData(solE[:,0], solE[:,1],'b-','a(t)','c(t)',"6 ini (E)")
+
+        plt.show()
+
+    # Conservation of the first integral over a long run: the symplectic
+    # schemes keep it bounded, while it drifts with RK2 and explicit Euler.
+    with timers.phase('invariants'):
+        for name,scheme in (("Euler",ExplicitEuler(model)),("RK2",RK2(model)),
+                            ("Leapfrog",Leapfrog(model)),("Yoshida4",Yoshida4(model))):
+            monitor = InvariantMonitor(model.invariant)
+            integrator = Integrator(scheme,x0,tmin,tmax,N)
+            for t,x in zip(integrator.getIntegrationTime(),integrator.integrate()):
+                monitor.record(t,x)
+            print(name,monitor)
+
+    # Parameter scan: all the (k_a,k_ca,k_c,k_ac) combinations are
+    # integrated together in a single call of the batch integrator.
+    with timers.phase('parameter scan'):
+        rates = parameterGrid(k_a=np.linspace(0.5,1.5,10),k_ca=np.linspace(0.5,1.5,10),
+                              k_c=np.linspace(0.25,0.75,10),k_ac=np.linspace(0.25,0.75,10))
+        batch = BatchIntegrator(RK2(LotkaVolterra(**rates)),np.tile(x0,(rates['k_a'].size,1)),tmin,tmax,N)
+        solBatch = batch.integrate()
+    print("Parameter scan:",solBatch.shape[0],"trajectories, maximum antelope population",np.max(solBatch[:,:,0]))
+
+    # Convergence study: all the resolutions and schemes are integrated
+    # concurrently, each trajectory once, and the reference solution is the
+    # Richardson extrapolation of the two finest resolutions.
+    from convergence import ConvergenceStudy, nestedResolutions
+
+    with timers.phase('convergence study'):
+        study = ConvergenceStudy(model,x0,0,13)
+        results = study.run([RK2,ExplicitEuler],nestedResolutions(1001,4))
+
+    for scheme,label,color in ((RK2,"RK2 error",'ro'),(ExplicitEuler,"Euler error",'bo')):
+        n = results[scheme]['resolutions']
+        err = results[scheme]['errors']
+        print(label,err,"observed order",results[scheme]['order'])
+        if plot:
+            plt.loglog(n,err,color,linewidth=2.0,label=label)
+            plt.loglog(n,err[0]*np.power(n/n[0],-scheme.order),'k-',linewidth=2.0,
+                       label="-"+str(scheme.order)+" slope")
+            plt.legend(loc=3)
+            plt.show()
+    return solRK
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,106 @@
+# Accelerated backends for the fixed-step integration of the models of
+# lotkaVolterra.py. The right-hand side of the model and the time-stepping
+# loop are compiled together with numba when it is installed, which removes
+# the Python call overhead of evaluating the model at each stage. Without
+# numba, the preallocated NumPy Integrator of lotkaVolterra.py is used.
+
+import numpy as np
+
+from lotkaVolterra import LotkaVolterra, Logistic, ExplicitEuler, RK2, Integrator
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def jit(f):
+    return numba.njit(f) if numba is not None else f
+
+### RIGHT-HAND SIDES ##########################################
+# Scalar versions of the models, writing f(x,t) into out. The operations are
+# done in the same order as in the NumPy models, so that the trajectories of
+# the backends agree to the last digit.
+
+def lotkaVolterraRhs(x, t, p, out):
+    out[0] = p[0]*x[0]-p[1]*x[0]*x[1]
+    out[1] = -p[2]*x[1]+p[3]*x[0]*x[1]
+
+def logisticRhs(x, t, p, out):
+    for j in range(x.shape[0]):
+        out[j] = p[0]*(1-x[j]/p[1])*x[j]
+
+# Model class -> (right-hand side, function returning the parameter vector).
+kernels = {
+    LotkaVolterra: (lotkaVolterraRhs, lambda m: [m.k_a, m.k_ca, m.k_c, m.k_ac]),
+    Logistic:      (logisticRhs, lambda m: [m.nu, m.C]),
+}
+
+### STEPPING LOOPS ############################################
+
+def makeLoop(scheme, rhs):
+    """Returns the integration loop of the given scheme for the
+    given right-hand side, compiled with numba when available.
+    """
+    rhs = jit(rhs)
+    if scheme is ExplicitEuler:
+        def loop(x, t, dt, p):
+            k = np.empty(x.shape[1])
+            for i in range(x.shape[0]-1):
+                rhs(x[i], t[i], p, k)
+                for j in range(x.shape[1]):
+                    x[i+1,j] = x[i,j]+dt*k[j]
+    elif scheme is RK2:
+        def loop(x, t, dt, p):
+            k1 = np.empty(x.shape[1])
+            k2 = np.empty(x.shape[1])
+            xMid = np.empty(x.shape[1])
+            for i in range(x.shape[0]-1):
+                rhs(x[i], t[i], p, k1)
+                for j in range(x.shape[1]):
+                    xMid[j] = x[i,j]+dt/2*k1[j]
+                rhs(xMid, t[i]+dt/2, p, k2)
+                for j in range(x.shape[1]):
+                    x[i+1,j] = x[i,j]+dt*k2[j]
+    else:
+        raise ValueError("No compiled loop for scheme "+scheme.__name__)
+    return jit(loop)
+
+# Cache of the compiled loops, per (scheme, model class).
+loops = {}
+
+def availableBackends():
+    return ['numba', 'numpy'] if numba is not None else ['numpy']
+
+class CompiledIntegrator(Integrator):
+    """This class defines the Integration of a differential
+    equation with the same interface and results as Integrator,
+    but with a selectable backend:
+        'numba'  compiled model and stepping loop (single trajectory)
+        'numpy'  preallocated NumPy loop of Integrator (also batches)
+    The default is 'numba' when it is installed, 'numpy' otherwise.
+    """
+    def __init__(self, method, x0, tMin, tMax, N, backend=None):
+        Integrator.__init__(self, method, x0, tMin, tMax, N)
+        if backend is None:
+            backend = availableBackends()[0]
+        if backend not in availableBackends():
+            raise ValueError("Backend "+backend+" is not available")
+        self.backend = backend
+
+    def integrate(self):
+        model = self.f.f
+        compiled = (self.backend == 'numba' and np.ndim(self.x0) == 1
+                    and type(model) in kernels
+                    and type(self.f) in (ExplicitEuler, RK2))
+        if not compiled:
+            return Integrator.integrate(self)
+
+        rhs, parameters = kernels[type(model)]
+        key = (type(self.f), type(model))
+        if key not in loops:
+            loops[key] = makeLoop(type(self.f), rhs)
+        x = np.empty((self.N, np.size(self.x0)))
+        x[0] = self.x0
+        loops[key](x, self.getIntegrationTime(), self.dt,
+                   np.array(parameters(model), dtype=float))
+        return x
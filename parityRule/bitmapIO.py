@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Compact input and output of the states of binary cellular automata.
+#
+# The states are either unpacked, one uint8 per cell (0 or 1), or packed, one
+# bit per cell: each row is a sequence of bytes, the first cell of the row
+# being the most significant bit of the first byte (numpy.packbits order),
+# and the bits past the width of the row being 0. Two file formats are
+# memory-mapped, so that a state is only read from disk when it is used:
+#   - monochrome (1 bit per pixel, uncompressed) BMP files, whose pixel data
+#     are packed rows padded to 4 bytes, stored bottom-up;
+#   - raw bit-packed grids: the packed rows one after the other, without
+#     header, the shape being known by the caller.
+# In both cases a pixel is 1 when it is white, 0 when it is black.
+
+import struct
+import numpy as np
+
+def rowBytes(width):
+    return (width + 7) // 8
+
+def readBmpHeader(fileName):
+    # Returns (width, height, offset of the pixels, bytes per row, bottom-up,
+    # white index) of a monochrome BMP.
+    with open(fileName, 'rb') as f:
+        header = f.read(62)
+    if header[:2] != b'BM':
+        raise ValueError(fileName + " is not a BMP file")
+    offset, = struct.unpack_from('<I', header, 10)
+    size, width, height, planes, bits, compression = struct.unpack_from('<IiiHHI', header, 14)
+    if bits != 1 or compression != 0:
+        raise ValueError(fileName + " is not an uncompressed monochrome BMP")
+    # The pixel value of white is the palette entry of highest brightness.
+    palette = np.frombuffer(header, np.uint8, 8, 14 + size).reshape(2, 4)[:, :3]
+    white = int(palette[1].sum() > palette[0].sum())
+    return width, abs(height), offset, (rowBytes(width) + 3) // 4 * 4, height > 0, white
+
+def readBmp(fileName, packed=False, mode='r'):
+    # Memory-maps a monochrome BMP. The packed state is a view of the file
+    # (in mode 'r+', writing into it changes the file), unless the palette
+    # has white first, in which case the bits are inverted in memory. The
+    # unpacked state is a uint8 array in memory.
+    width, height, offset, stride, bottomUp, white = readBmpHeader(fileName)
+    rows = np.memmap(fileName, np.uint8, mode, offset, (height, stride))
+    bits = rows[::-1, :rowBytes(width)] if bottomUp else rows[:, :rowBytes(width)]
+    if not white:
+        bits = invert(bits, width)
+    return bits if packed else unpack(bits, width)
+
+def writeBmp(fileName, state, width=None):
+    # Writes a state (packed if width is given, unpacked otherwise) as a
+    # monochrome BMP, through a memory map of the new file.
+    bits = asPacked(state, width)
+    width = width if width is not None else state.shape[1]
+    height = bits.shape[0]
+    stride = (rowBytes(width) + 3) // 4 * 4
+    offset = 62
+    with open(fileName, 'wb') as f:
+        f.write(b'BM' + struct.pack('<IHHI', offset + stride*height, 0, 0, offset))
+        f.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 1, 0,
+                            stride*height, 2835, 2835, 2, 2))
+        f.write(bytes([0, 0, 0, 0, 255, 255, 255, 0]))
+        f.truncate(offset + stride*height)
+    if height > 0:
+        rows = np.memmap(fileName, np.uint8, 'r+', offset, (height, stride))
+        for start in range(0, height, chunkRows(bits.shape[1])):
+            stop = min(height, start + chunkRows(bits.shape[1]))
+            rows[height-stop:height-start, :bits.shape[1]] = bits[start:stop][::-1]
+        rows.flush()
+
+def openBits(fileName, shape, mode='r'):
+    # Memory-maps a raw bit-packed grid of shape (height, width): mode 'r'
+    # (read only), 'r+' (read and write) or 'w+' (new file).
+    height, width = shape
+    return np.memmap(fileName, np.uint8, mode, 0, (height, rowBytes(width)))
+
+def readBits(fileName, shape, packed=True):
+    bits = openBits(fileName, shape)
+    return bits if packed else unpack(bits, shape[1])
+
+def writeBits(fileName, state, width=None):
+    bits = asPacked(state, width)
+    out = openBits(fileName, (bits.shape[0], width if width is not None else state.shape[1]), 'w+')
+    for start in range(0, bits.shape[0], chunkRows(bits.shape[1])):
+        out[start:start + chunkRows(bits.shape[1])] = bits[start:start + chunkRows(bits.shape[1])]
+    out.flush()
+
+def chunkRows(nbytes, chunkBytes=2**24):
+    # Number of rows processed at once, to bound the temporary arrays.
+    return max(1, chunkBytes // max(1, nbytes))
+
+def unpack(bits, width):
+    return np.unpackbits(bits, axis=1, count=width)
+
+def pack(state):
+    return np.packbits(np.asarray(state, dtype=np.uint8) & 1, axis=1)
+
+def asPacked(state, width=None):
+    return state if width is not None else pack(state)
+
+def paddingMask(width):
+    # Mask of the valid bits of the last byte of a row.
+    return np.uint8((0xff00 >> (width - 8*(rowBytes(width) - 1))) & 0xff)
+
+def invert(bits, width):
+    inverted = ~bits
+    inverted[:, -1] &= paddingMask(width)
+    return inverted
+
+def countOnes(bits):
+    # Number of cells in state 1 of a packed state, by chunks of rows.
+    table = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+    step = chunkRows(bits.shape[1])
+    return sum(int(table[bits[start:start+step]].sum()) for start in range(0, bits.shape[0], step))
+
+def parityStepPacked(bits, width, out=None):
+    # One iteration of the parity rule (with periodic boundaries) on a packed
+    # state: the four neighbours are obtained by shifting whole rows (North,
+    # South) and the bits inside the bytes (West, East), and summed modulo 2
+    # with XOR. out may be a memory-mapped grid; it must not be bits.
+    height, nbytes = bits.shape
+    out = np.empty_like(bits) if out is None else out
+    last = width - 1
+    lastByte, lastBit = last // 8, 7 - last % 8
+    step = chunkRows(nbytes)
+    for start in range(0, height, step):
+        stop = min(height, start + step)
+        rows = np.arange(start, stop)
+        b = np.asarray(bits[start:stop])
+        north = np.asarray(bits[(rows - 1) % height])
+        south = np.asarray(bits[(rows + 1) % height])
+        # Periodic neighbours of the first and last cells of the rows.
+        first = b[:, 0] >> 7
+        final = (b[:, lastByte] >> lastBit) & 1
+        # East neighbour: cell j+1, i.e. the bits shifted left by one.
+        east = b << 1
+        east[:, :-1] |= b[:, 1:] >> 7
+        east[:, lastByte] &= ~np.uint8(1 << lastBit)
+        east[:, lastByte] |= first << lastBit
+        # West neighbour: cell j-1, i.e. the bits shifted right by one.
+        west = b >> 1
+        west[:, 1:] |= b[:, :-1] << 7
+        west[:, 0] = (west[:, 0] & 0x7f) | (final << 7)
+        result = north ^ south ^ east ^ west
+        result[:, -1] &= paddingMask(width)
+        out[start:stop] = result
+    return out
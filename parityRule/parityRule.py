@@ -8,15 +8,36 @@
 from numpy import *
 import matplotlib.pyplot as plt
 from matplotlib import cm
-import scipy
-import copy
+from contextlib import nullcontext
+import os
+try:
+    from .bitmapIO import readBmpHeader, readBmp, writeBmp, writeBits, unpack, countOnes, parityStepPacked
+except ImportError: # Run as a script from this directory.
+    from bitmapIO import readBmpHeader, readBmp, writeBmp, writeBits, unpack, countOnes, parityStepPacked
     
 # Definition of functions
-def readImage(string): # This function only work for monochrome BMP. 
-    image =  scipy.misc.imread(string,1);
+def readImage(string, packed=False): # This function only work for monochrome BMP. 
+    # Monochrome BMPs are memory-mapped by bitmapIO: white pixels are 1, black
+    # ones 0, as uint8 (or packed bits if packed is True). Other images are
+    # read with matplotlib as RGB(A), and flattened to gray levels like
+    # scipy.misc.imread(string,1) did.
+    try:
+        return readBmp(string, packed)
+    except ValueError:
+        if packed:
+            raise
+    image = plt.imread(string).astype(float)
+    if image.ndim == 3:
+        image = image[:,:,:3].mean(axis=2)
     image[image == 255] = 1
-    image = image.astype(int) 
-    return image # Note that the image output is a numPy array of type "int".
+    image = image.astype(uint8) 
+    return image # Note that the image output is a numPy array of type "uint8".
+
+def parityStep(image):
+    # One iteration of the parity rule with periodic boundaries: each pixel
+    # becomes the sum modulo 2 of its four neighbours (North, South, West, East).
+    return (roll(image,1,axis=0) + roll(image,-1,axis=0) +
+            roll(image,1,axis=1) + roll(image,-1,axis=1)) % 2
 
 # Main Program
 
@@ -24,41 +45,57 @@ def readImage(string): # This function only work for monochrome BMP.
 imageName = 'image3.bmp'
 maxIter   = 32
 
-# Read the image and store it in the array "image"
-image = readImage(imageName) # Note that "image" is a numPy array of type "int".
-# Its element are obtained as image[i,j]
-# Also, in the array "image" a white pixel correspond to an entry of 1 and a black pixel to an entry of 0.
+def run(imageName=imageName, maxIter=maxIter, packed=False, output=None, plot=True,
+        timers=None):
+    # With packed True, the image is kept with one bit per pixel (see
+    # bitmapIO.py). The final image is written to output if given, as a BMP or
+    # else as a raw bit-packed grid.
+    phase = (lambda name: nullcontext()) if timers is None else timers.phase
+    # The image is looked for in the current directory, then next to this file.
+    if not os.path.exists(imageName):
+        imageName = os.path.join(os.path.dirname(os.path.abspath(__file__)), imageName)
 
-# Get the shape of the image , i.e. the number of pixels horizontally and vertically. 
-# Note that the function shape return a type "tuple" (vertical_size,horizontal_size)
-imageSize = shape(image);
+    # Read the image and store it in the array "image"
+    image = readImage(imageName, packed) # Note that "image" is a numPy array of type "uint8".
+    # Its element are obtained as image[i,j]
+    # Also, in the array "image" a white pixel correspond to an entry of 1 and a black pixel to an entry of 0.
 
-# Print to screen the initial image.
-print('Initial image:')
-plt.clf()
-plt.imshow(image, cmap=cm.gray)
-plt.show()
-plt.pause(0.1)
+    # Get the shape of the image , i.e. the number of pixels horizontally and vertically. 
+    # Note that the function shape return a type "tuple" (vertical_size,horizontal_size)
+    imageSize = shape(image);
+    width = readBmpHeader(imageName)[0] if packed else imageSize[1]
 
-# Main loop
-for it in range(1,maxIter+1):
-    
-    imageCopy = copy.copy(image);
+    # Print to screen the initial image.
+    if plot:
+        print('Initial image:')
+        plt.clf()
+        plt.imshow(unpack(image, width) if packed else image, cmap=cm.gray)
+        plt.show()
+        plt.pause(0.1)
+
+    # Main loop
+    for it in range(1,maxIter+1):
     
-    for i in range(0,imageSize[0]):  
-        for j in range(0,imageSize[1]):             
-            iM = (i-1) % imageSize[0]
-            iP = (i+1) % imageSize[0]            
-            jM = (j-1) % imageSize[1]
-            jP = (j+1) % imageSize[1]
-            image[i,j] = (imageCopy[iM,j] + imageCopy[iP,j] + imageCopy[i,jM] + imageCopy[i,jP]) % 2
+        with phase('ca update'):
+            image = parityStepPacked(image, width) if packed else parityStep(image)
     
-    # Print to screen the image after each iteration.
-    print('Image after',it,'iterations:')
-    plt.clf()
-    plt.imshow(image, cmap=cm.gray)
-    plt.show()
-    plt.pause(0.1)
+        # Print to screen the image after each iteration.
+        if plot:
+            print('Image after',it,'iterations:')
+            plt.clf()
+            plt.imshow(unpack(image, width) if packed else image, cmap=cm.gray)
+            plt.show()
+            plt.pause(0.1)
         
-# Print to screen the number of white pixels in the final image
-print("The number of white pixels after",it,"iterations is: ", sum(image))
\ No newline at end of file
+    # Print to screen the number of white pixels in the final image
+    print("The number of white pixels after",it,"iterations is: ",
+          countOnes(image) if packed else sum(image))
+    if output is not None:
+        if output.lower().endswith('.bmp'):
+            writeBmp(output, image, width if packed else None)
+        else:
+            writeBits(output, image, width if packed else None)
+    return image
+
+if __name__ == '__main__':
+    run()
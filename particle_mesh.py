@@ -0,0 +1,205 @@
+# Particle-mesh (PM) gravity solver for the N-body simulations of
+# barnes_hut.py and barnes_hut_3D.py, with an optional P3M short-range
+# correction.
+#
+# The masses are deposited on a regular mesh with the cloud-in-cell (CIC)
+# scheme, the Poisson equation is solved with FFTs and the mesh force is
+# interpolated back to the bodies with the same CIC weights. The cost is
+# O(N + M log M) for M mesh cells, instead of O(N log N) tree walks.
+#
+# The mesh only carries the long-range part -erf(r/(2 rs))/r of the potential
+# of a body, smooth at the scale rs (the split of the TreePM of GADGET): the
+# mesh force is then isotropic, and exact beyond a few rs. With p3m=True, the
+# pairs closer than rcut are corrected: the radial mesh force between two bodies, measured
+# once on the mesh and tabulated, is replaced by the exact force of
+# Node.force_on, short-distance cutoff included.
+#
+# Boundaries are either periodic (box of n cells, with the neutralizing
+# background and the images of periodic.py), or isolated: the mesh is then padded with zeros to twice
+# its size and the potential is the convolution with the real-space kernel
+# (the method of Hockney and Eastwood). The solver works in mesh units,
+# so that the tables do not depend on the physical cell size h.
+
+from itertools import product
+import numpy as np
+from scipy.integrate import trapezoid
+from scipy.spatial import cKDTree
+from scipy.special import erf, erfc, j0
+from periodic import PeriodicBox
+
+class ParticleMesh:
+# Mesh of n**dim cells. smoothing is rs in cells, cutoff is rcut in units of
+# rs, cutoff_dist is the short-distance cutoff of the exact pair force.
+
+    def __init__(self, n, dim=2, periodic=False, p3m=False, smoothing=1.25,
+                 cutoff=4.5, cutoff_dist=0.002):
+        self.n = n
+        self.dim = dim
+        self.periodic = periodic
+        self.p3m = p3m
+        self.rs = smoothing
+        self.rcut = cutoff*smoothing
+        self.cutoff_dist = cutoff_dist
+        self.corners = np.array(list(product((0, 1), repeat=dim)))
+        self.green = self._green()
+        if p3m:
+            self.table_r, self.table_f = self.pair_force_table()
+
+    def _green(self):
+    # Fourier transform of the long-range potential -erf(r/(2 rs))/r of a unit
+    # mass, on the rfft grid of the mesh (doubled in the isolated case), with
+    # the CIC window of the deposit and of the interpolation deconvolved.
+        size = self.n if self.periodic else 2*self.n
+        k = [2*np.pi*np.fft.fftfreq(size) for i in range(self.dim-1)]
+        k.append(2*np.pi*np.fft.rfftfreq(size))
+        k = np.meshgrid(*k, indexing='ij', sparse=True)
+        k2 = sum(ki**2 for ki in k)
+        if not self.periodic:
+            x = np.minimum(np.arange(size), size-np.arange(size))
+            r = np.sqrt(sum(xi**2 for xi in np.meshgrid(*[x]*self.dim, indexing='ij', sparse=True)))
+            a = 0.5/self.rs
+            kernel = -erf(a*r)/np.maximum(r, 1e-300)
+            kernel[(0,)*self.dim] = -2*a/np.sqrt(np.pi)
+            green = np.fft.rfftn(kernel)
+        elif self.dim == 3:
+            k2[(0,)*self.dim] = 1.
+            green = -4*np.pi/k2*np.exp(-k2*self.rs**2)
+        else:
+            # Bodies in a plane with the 1/r**2 law of barnes_hut.py: 2D
+            # transform of -1/r, minus the (Hankel) transform of the
+            # short-range part -erfc(r/(2 rs))/r.
+            k2[(0,)*self.dim] = 1.
+            kabs = np.sqrt(k2)
+            r = np.linspace(0., 12*self.rs, 2401)
+            values, inverse = np.unique(kabs, return_inverse=True)
+            short = trapezoid(erfc(0.5*r/self.rs)*j0(values[:, None]*r), r, axis=1)
+            green = -2*np.pi*(1./kabs - short[inverse].reshape(kabs.shape))
+        if self.periodic:
+            # Neutralizing background.
+            green[(0,)*self.dim] = 0.
+        window = 1.
+        for ki in k:
+            window = window*np.sinc(ki/(2*np.pi))**2
+        return green/window**2
+
+    def _cic(self, u):
+    # Lower mesh cell and CIC weights of the 2**dim surrounding cells, for
+    # positions u in mesh units (cell centres at integer + 1/2).
+        u = u - 0.5
+        i = np.floor(u).astype(int)
+        t = u - i
+        weights = np.ones((self.corners.shape[0], u.shape[0]))
+        for c, corner in enumerate(self.corners):
+            for k in range(self.dim):
+                weights[c] *= t[:, k] if corner[k] else 1-t[:, k]
+        return i, weights
+
+    def _indices(self, i, corner, size):
+        return tuple((i+corner).T % size)
+
+    def deposit(self, u, m):
+    # Mass of each mesh cell.
+        size = self.n if self.periodic else 2*self.n
+        rho = np.zeros((size,)*self.dim)
+        i, weights = self._cic(u)
+        for corner, w in zip(self.corners, weights):
+            np.add.at(rho, self._indices(i, corner, size), w*m)
+        return rho
+
+    def mesh_accelerations(self, rho):
+    # Accelerations on the mesh (one array per direction), by spectral
+    # differentiation of the potential.
+        size = rho.shape[0]
+        phi = np.fft.rfftn(rho)*self.green
+        k = [2*np.pi*np.fft.fftfreq(size) for i in range(self.dim-1)]
+        k.append(2*np.pi*np.fft.rfftfreq(size))
+        acc = []
+        for axis in range(self.dim):
+            ki = k[axis].copy()
+            if size % 2 == 0:
+                ki[size//2] = 0.
+            shape = [1]*self.dim
+            shape[axis] = ki.size
+            acc.append(np.fft.irfftn(-1j*ki.reshape(shape)*phi, rho.shape))
+        return acc
+
+    def interpolate(self, acc, u):
+    # Mesh accelerations at the positions u.
+        size = acc[0].shape[0]
+        i, weights = self._cic(u)
+        result = np.zeros(u.shape)
+        for corner, w in zip(self.corners, weights):
+            index = self._indices(i, corner, size)
+            for k in range(self.dim):
+                result[:, k] += w*acc[k][index]
+        return result
+
+    def pair_force_table(self, sources=8, samples=4000, bins=None):
+    # Mean radial mesh force between two unit masses at distance r < rcut
+    # (in mesh units), measured from random source positions and directions.
+    # In a periodic box, the force of the other images of the source and of
+    # the background is left out: it belongs to the long-range part.
+        rng = np.random.RandomState(0)
+        box = PeriodicBox(self.n, self.dim) if self.periodic else None
+        bins = bins or int(8*self.rcut)
+        r = np.zeros(0)
+        f = np.zeros(0)
+        for s in range(sources):
+            source = self.n/2. + rng.random_sample(self.dim)
+            acc = self.mesh_accelerations(self.deposit(source[None, :], np.ones(1)))
+            direction = rng.normal(size=(samples, self.dim))
+            direction /= np.sqrt((direction**2).sum(axis=1))[:, None]
+            distance = self.rcut*np.sqrt(rng.random_sample(samples))
+            a = self.interpolate(acc, source + distance[:, None]*direction)
+            if box is not None:
+                a -= box.correction(-distance[:, None]*direction)
+            r = np.append(r, distance)
+            f = np.append(f, -(a*direction).sum(axis=1))
+        edges = np.linspace(0., self.rcut, bins+1)
+        which = np.minimum(np.digitize(r, edges)-1, bins-1)
+        mean = np.bincount(which, f, bins)/np.maximum(np.bincount(which, minlength=bins), 1)
+        centres = 0.5*(edges[1:]+edges[:-1])
+        return np.concatenate(([0.], centres)), np.concatenate(([0.], mean))
+
+    def long_range(self, pos, m, origin, h):
+    # Mesh forces on the bodies at positions pos (shape (N, dim)) with masses
+    # m, for a mesh of cell size h with lower corner origin.
+        u = (np.asarray(pos, dtype=float) - origin)/h
+        if self.periodic:
+            u %= self.n
+        elif u.min() < 0.5 or u.max() > self.n-0.5:
+            raise ValueError("bodies outside of the mesh")
+        acc = self.mesh_accelerations(self.deposit(u, m))
+        return self.interpolate(acc, u)*m[:, None]/h**2
+
+    def short_range(self, pos, m, origin, h):
+    # P3M correction: exact minus mesh force for the pairs closer than rcut.
+        u = (np.asarray(pos, dtype=float) - origin)/h
+        if self.periodic:
+            u %= self.n
+            tree = cKDTree(u, boxsize=self.n)
+        else:
+            tree = cKDTree(u)
+        pairs = tree.query_pairs(self.rcut, output_type='ndarray')
+        i, j = pairs[:, 0], pairs[:, 1]
+        d = u[j] - u[i]
+        if self.periodic:
+            d -= self.n*np.round(d/self.n)
+        r = np.sqrt((d**2).sum(axis=1))
+        exact = np.where(r*h >= self.cutoff_dist, 1./np.maximum(r, 1e-300)**2, 0.)
+        f = (exact - np.interp(r, self.table_r, self.table_f))*m[i]*m[j]/h**2
+        f = d*(f/np.maximum(r, 1e-300))[:, None]
+        forces = np.zeros(u.shape)
+        for k in range(self.dim):
+            forces[:, k] = (np.bincount(i, f[:, k], u.shape[0])
+                            - np.bincount(j, f[:, k], u.shape[0]))
+        return forces
+
+    def forces(self, pos, m, origin, h):
+    # Gravitational forces on the bodies (without the gravitational constant,
+    # like force_on of the tree codes).
+        m = np.asarray(m, dtype=float)
+        forces = self.long_range(pos, m, origin, h)
+        if self.p3m:
+            forces += self.short_range(pos, m, origin, h)
+        return forces
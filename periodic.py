@@ -0,0 +1,100 @@
+# Periodic boundaries for the Barnes-Hut N-body simulations.
+#
+# In a periodic box of side L every body interacts with all the periodic
+# images of the others. The tree walk uses the nearest (minimum-image)
+# displacement to each node, and adds the force of all the other images as a
+# correction, smooth in the displacement, which is precomputed once on a grid
+# and interpolated (the approach of the GADGET code):
+#   - in 3D with Ewald summation, for a box with a uniform neutralizing
+#     background, as in cosmological simulations;
+#   - in 2D (bodies in a plane, 1/r**2 law of barnes_hut.py) by direct
+#     summation over the images in a large disk around the target, which
+#     converges since the in-plane forces of a uniform sheet vanish.
+
+from itertools import product
+from math import pi, sqrt
+import numpy as np
+from scipy.special import erfc as erfc_array
+
+def ewald_force(y, L, alpha=None, nreal=2, nrecip=5):
+# Force of a unit mass and all its periodic images, plus a uniform
+# neutralizing background, at the displacements y (shape (..., 3), from the
+# target to the source), in a cubic box of side L. Ewald summation with
+# splitting parameter alpha.
+    alpha = 2./L if alpha is None else alpha
+    y = np.asarray(y, dtype=float)
+    force = np.zeros(y.shape)
+    for n in product(range(-nreal, nreal+1), repeat=3):
+        d = y + L*np.array(n)
+        r = np.sqrt((d**2).sum(axis=-1))
+        self_term = r == 0
+        r = np.where(self_term, 1., r)
+        factor = (erfc_array(alpha*r) + 2*alpha*r/sqrt(pi)*np.exp(-(alpha*r)**2))/r**3
+        force += d*np.where(self_term, 0., factor)[..., None]
+    for h in product(range(-nrecip, nrecip+1), repeat=3):
+        if h == (0, 0, 0):
+            continue
+        k = 2*pi*np.array(h)/L
+        k2 = k.dot(k)
+        force += (4*pi/L**3 * np.exp(-k2/(4*alpha**2))/k2
+                  * np.sin(y.dot(k)))[..., None] * k
+    return force
+
+def image_force(y, L, nimages=64):
+# Force of a unit mass and all its periodic images in the plane, at the
+# displacements y (shape (..., 2)), summed over the images closer than
+# nimages*L to the target: this disk, symmetric about the target, makes the
+# far images cancel each other to leading order.
+    y = np.asarray(y, dtype=float)
+    force = np.zeros(y.shape)
+    radius = nimages*L
+    n = nimages+1
+    shifts = L*np.array(list(product(range(-n, n+1), repeat=2)), dtype=float)
+    for chunk in np.array_split(shifts, max(1, shifts.shape[0]//2048)):
+        d = y[..., None, :] + chunk
+        r = np.sqrt((d**2).sum(axis=-1))
+        r = np.where((r == 0) | (r > radius), np.inf, r)
+        force += (d/r[..., None]**3).sum(axis=-2)
+    return force
+
+class PeriodicBox:
+# Periodic box [0,L)**dim, with the table of the force correction on the
+# displacements of the first octant [0,L/2]**dim (the correction is odd in
+# each component of the displacement).
+
+    def __init__(self, L, dim, table_points=17):
+        self.L = float(L)
+        self.dim = dim
+        self.n = table_points
+        self.h = 0.5*self.L/(table_points-1)
+        axis = np.arange(table_points)*self.h
+        grid = np.stack(np.meshgrid(*[axis]*dim, indexing='ij'), axis=-1)
+        total = ewald_force(grid, self.L) if dim == 3 else image_force(grid, self.L)
+        r = np.sqrt((grid**2).sum(axis=-1))
+        r = np.where(r == 0, np.inf, r)
+        self.table = total - grid/r[..., None]**3
+        self.corners = list(product((0, 1), repeat=dim))
+
+    def wrap(self, pos):
+    # Position brought back into the box.
+        return pos % self.L
+
+    def min_image(self, d):
+    # Displacement to the nearest periodic image.
+        return d - self.L*np.round(d/self.L)
+
+    def correction(self, d):
+    # Force of all the images but the nearest one, for the minimum-image
+    # displacements d (shape (..., dim), from the target to the source), by
+    # multilinear interpolation in the table.
+        a = np.abs(d)/self.h
+        i = np.minimum(a.astype(int), self.n-2)
+        t = a - i
+        c = np.zeros(np.shape(d))
+        for corner in self.corners:
+            w = 1.
+            for k in range(self.dim):
+                w = w*(t[..., k] if corner[k] else 1-t[..., k])
+            index = tuple(np.moveaxis(i+np.array(corner), -1, 0))
+            c += np.asarray(w)[..., None]*self.table[index]
+        return np.sign(d)*c
@@ -2,36 +2,79 @@ import numpy as np
 import math
 import random
 import matplotlib.pyplot as plt
+from profiling import timers_or_none
 
 maxPerPile = 10
 numberOfPiles = 10
 maxIter = 100
-x = 0
 
-piles_left = []
+# At each iteration, the empty piles are removed, then every remaining pile
+# gives one token to a pile chosen at random among them. The tokens all leave
+# before any choice matters, so the moves of an iteration amount to removing
+# one token per pile and adding the counts of the random choices.
 
-piles = np.empty(numberOfPiles)
-piles.fill(10)
-#print(piles)
-totPiles = np.sum(piles)
-#print(totPiles)
-numPiles = np.array([piles.size])
-while(True):
-    if (piles.size > 1 and totPiles == np.sum(piles)):
+def absorption_time(numberOfPiles, maxPerPile):
+    # Number of iterations until a single pile is left, for one realization.
+    piles = np.empty(numberOfPiles)
+    piles.fill(maxPerPile)
+    totPiles = np.sum(piles)
+    numPiles = [piles.size]
+    x = 0
+    while(True):
         piles = piles[np.nonzero(piles)]
         if(piles.size == 1):
-        	break
-        #piles_left.append(piles.size)
-        for i in np.arange(piles.size):
-            piles[i] -= 1
-            num = np.random.randint(piles.size)
-            piles[num] += 1
-        numPiles = np.append(numPiles,piles.size)
+            break
+        piles += np.bincount(np.random.randint(piles.size, size=piles.size),
+                             minlength=piles.size) - 1
+        assert totPiles == np.sum(piles)
+        numPiles.append(piles.size)
         x += 1
+    return x
 
-print(x)
+def simulate_ensemble(numberOfPiles, maxPerPile, replicas):
+    # Absorption times of independent realizations, all simulated together.
+    # Row r of "piles" holds the state of replica r; an empty pile stays in
+    # the array as a 0, and is excluded from the random choices.
+    piles = np.full((replicas, numberOfPiles), maxPerPile, dtype=np.int64)
+    x = np.zeros(replicas, dtype=np.int64)
+    active = np.arange(replicas)
+    while active.size > 0:
+        nonEmpty = piles[active] > 0
+        left = nonEmpty.sum(axis=1)
+        active, nonEmpty, left = active[left > 1], nonEmpty[left > 1], left[left > 1]
+        if active.size == 0:
+            break
+        # Columns of the non-empty piles first, in their original order.
+        columns = np.argsort(~nonEmpty, axis=1, kind='stable')
+        rank = (np.random.random(nonEmpty.shape) * left[:, None]).astype(np.int64)
+        target = np.take_along_axis(columns, rank, axis=1)
+        rows = np.broadcast_to(np.arange(active.size)[:, None], nonEmpty.shape)
+        moves = np.bincount(rows[nonEmpty] * numberOfPiles + target[nonEmpty],
+                            minlength=active.size * numberOfPiles)
+        piles[active] += moves.reshape(active.size, numberOfPiles) - nonEmpty
+        x[active] += 1
+    return x
+
+def run(numberOfPiles=numberOfPiles, maxPerPile=maxPerPile, replicas=1000, plot=True, timers=None):
+    timers = timers_or_none(timers)
+    with timers.phase('single run'):
+        x = absorption_time(numberOfPiles, maxPerPile)
+    print(x)
+
+    # Distribution of the absorption time over many realizations.
+    with timers.phase('ensemble'):
+        times = simulate_ensemble(numberOfPiles, maxPerPile, replicas)
+    print("mean absorption time over", replicas, "realizations:", times.mean(),
+          "standard deviation:", times.std())
+    if plot:
+        plt.hist(times, bins=50)
+        plt.xlabel('Absorption time')
+        plt.ylabel('Number of realizations')
+        plt.show()
+    return times
 #plt.plot(range(maxIter),piles_left)
 #plt.title('Piles left vs No. of Iterations')
 #plt.show()
 
-
+if __name__ == '__main__':
+    run()
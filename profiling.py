@@ -0,0 +1,91 @@
+# Profiling hooks for the simulations: per-phase wall-clock timers, which the
+# simulations update around their main phases (tree build, force, collision,
+# streaming, event dispatch, ...), and a sampling profiler writing collapsed
+# stacks, the input format of flame graph tools.
+
+import sys, threading, time
+from collections import defaultdict
+from contextlib import contextmanager
+
+class PhaseTimers:
+    """Accumulates the time spent in named phases, with
+
+        with timers.phase('streaming'):
+            ...
+
+    The phases are reported in the order in which they were first entered.
+    """
+    def __init__(self):
+        self.total = {}
+        self.calls = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.total[name] = self.total.get(name, 0.) + elapsed
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def as_dict(self):
+        return dict((name, {'seconds': self.total[name], 'calls': self.calls[name]})
+                    for name in self.total)
+
+    def report(self):
+        lines = ["{0:<20} {1:>10} {2:>10} {3:>12}".format("phase", "calls", "total[s]", "per call[s]")]
+        for name in self.total:
+            lines.append("{0:<20} {1:>10d} {2:>10.4f} {3:>12.3e}".format(
+                name, self.calls[name], self.total[name], self.total[name]/self.calls[name]))
+        return "\n".join(lines)
+
+class NoTimers:
+    """Stand-in for PhaseTimers when the phases are not timed."""
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def as_dict(self):
+        return {}
+
+def timers_or_none(timers):
+    return NoTimers() if timers is None else timers
+
+class SamplingProfiler:
+    """Samples the call stack of the thread which starts it every interval
+    seconds, from a background thread, and counts the collapsed stacks
+    ("module:function;module:function ..."). Unlike cProfile, it does not
+    slow down the profiled code noticeably.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = defaultdict(int)
+        self._stop = threading.Event()
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                module = code.co_filename.replace('\\', '/').split('/')[-1]
+                stack.append("{0}:{1}".format(module, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, args=(threading.get_ident(),))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            for stack, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+                f.write("{0} {1}\n".format(stack, count))
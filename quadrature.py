@@ -0,0 +1,151 @@
+# Quadrature rules for vectorized integrands.
+#
+# An integrand is a function f(x, *args) evaluated element-wise on arrays. All
+# the rules integrate a batch of intervals [a,b] at once (a and b broadcast to
+# the batch shape), the optional args being arrays of parameters of the same
+# shape, one value per integral of the batch. Each call of f evaluates all the
+# nodes of all the integrals of the batch which are still being computed.
+
+import warnings
+import numpy as np
+
+def _batch(a, b, args):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float),
+                               *[np.asarray(p) for p in args])[:2]
+    shape = a.shape
+    args = [np.broadcast_to(p, shape).ravel() for p in args]
+    return a.ravel(), b.ravel(), args, shape
+
+def _eval(f, x, args, which=slice(None)):
+    # Evaluates f at the nodes x, of shape (integrals, nodes), passing to
+    # each row the parameters of the integral it belongs to.
+    return f(x, *[p[which][:, None] for p in args])
+
+def gaussLegendre(f, a, b, n=10, args=()):
+    """Gauss-Legendre rule with n nodes, exact for polynomials of degree 2n-1."""
+    a, b, args, shape = _batch(a, b, args)
+    nodes, weights = np.polynomial.legendre.leggauss(n)
+    mid, half = (a+b)/2, (b-a)/2
+    x = mid[:, None]+half[:, None]*nodes
+    return (half*_eval(f, x, args).dot(weights)).reshape(shape)
+
+### GAUSS-KRONROD #############################################
+
+# Nodes and weights of the 15 points Kronrod rule and of the embedded 7 points
+# Gauss rule, on [-1,1] (QUADPACK, Piessens et al. 1983).
+_xk = np.array([0.991455371120812639206854697526329, 0.949107912342758524526189684047851,
+                0.864864423359769072789712788640926, 0.741531185599394439863864773280788,
+                0.586087235467691130294144845693013, 0.405845151377397166906606412076961,
+                0.207784955007898467600689403773245, 0.000000000000000000000000000000000])
+_wk = np.array([0.022935322010529224963732008058970, 0.063092092629978553290700663189204,
+                0.104790010322250183839876322541518, 0.140653259715525918745189590510238,
+                0.169004726639267902826583426598550, 0.190350578064785409913256402421014,
+                0.204432940075298892414161999234649, 0.209482141084727828012999174891714])
+_wg = np.array([0., 0.129484966168869693270611432679082, 0., 0.279705391489276667901467771423780,
+                0., 0.381830050505118944950369775488975, 0., 0.417959183673469387755102040816327])
+kronrodNodes = np.concatenate([-_xk[:-1], _xk[::-1]])
+kronrodWeights = np.concatenate([_wk[:-1], _wk[::-1]])
+gaussWeights = np.concatenate([_wg[:-1], _wg[::-1]])
+
+def gaussKronrod(f, a, b, tol=1e-10, maxLevel=60, args=(), full_output=False):
+    """Adaptive Gauss-Kronrod (G7,K15) quadrature. The intervals of all the
+    integrals of the batch are processed together: at each pass, the 15 nodes
+    of every interval to refine are evaluated in one call of f. The error of
+    an integral is the sum of the estimates |K15-G7| of its intervals; while
+    it exceeds tol*max(1,|I|), the intervals of largest error are bisected,
+    as many as needed for the others to fit in this budget. Intervals of
+    zero length give 0; where the integrand is not finite, the error
+    estimate is not finite either and the integral is not refined further.
+    A RuntimeWarning is emitted for the integrals which do not converge
+    within maxLevel bisections.
+
+    Returns the integrals, and with full_output also the error estimates and
+    the number of evaluations of the integrand.
+    """
+    a, b, args, shape = _batch(a, b, args)
+    n = a.size
+    lo, hi, owner, level = a, b, np.arange(n), np.zeros(n, dtype=int)
+    kronrod, err = np.zeros(0), np.zeros(0)
+    new = np.ones(n, dtype=bool)
+    nfev = 0
+    while True:
+        # Evaluation of the new intervals, appended at the end.
+        mid, half = (lo[new]+hi[new])/2, (hi[new]-lo[new])/2
+        fx = _eval(f, mid[:, None]+half[:, None]*kronrodNodes, args, owner[new])
+        nfev += fx.size
+        k = half*fx.dot(kronrodWeights)
+        kronrod = np.concatenate([kronrod, k])
+        err = np.concatenate([err, np.abs(k-half*fx.dot(gaussWeights))])
+        result = np.bincount(owner, kronrod, n)
+        error = np.bincount(owner, err, n)
+        budget = tol*np.maximum(1., np.abs(result))
+        active = (error > budget) & np.isfinite(error)
+        # Intervals which can still be bisected, by integral and by
+        # decreasing error: those before the remaining error of their
+        # integral fits in the budget are bisected.
+        candidates = np.flatnonzero(active[owner] & (level < maxLevel) & (err > 0))
+        if candidates.size == 0:
+            break
+        candidates = candidates[np.lexsort((-err[candidates], owner[candidates]))]
+        o = owner[candidates]
+        start = np.searchsorted(o, o)
+        before = np.cumsum(err[candidates])-err[candidates]
+        before -= (np.cumsum(err[candidates])-err[candidates])[start]
+        split = candidates[error[o]-before > budget[o]]
+        keep = np.ones(owner.size, dtype=bool)
+        keep[split] = False
+        m = (lo[split]+hi[split])/2
+        lo = np.concatenate([lo[keep], lo[split], m])
+        hi = np.concatenate([hi[keep], m, hi[split]])
+        owner = np.concatenate([owner[keep], owner[split], owner[split]])
+        level = np.concatenate([level[keep], level[split]+1, level[split]+1])
+        kronrod, err = kronrod[keep], err[keep]
+        new = np.arange(owner.size) >= keep.sum()
+    failed = ~(error <= budget)
+    if failed.any():
+        warnings.warn("gaussKronrod: {0} of {1} integrals did not converge to tol={2:g} "
+                      "(largest error {3:g})".format(failed.sum(), n, tol, error[failed].max()),
+                      RuntimeWarning)
+    if full_output:
+        return result.reshape(shape), error.reshape(shape), nfev
+    return result.reshape(shape)
+
+### ROMBERG ###################################################
+
+def romberg(f, a, b, tol=1e-10, maxLevel=20, args=(), full_output=False):
+    """Romberg integration: trapezoidal rules with 2**k intervals, the
+    function values being reused from one level to the next, improved by
+    Richardson extrapolation. Only the integrals of the batch which have
+    not converged to tol*max(1,|I|) are refined.
+    """
+    a, b, args, shape = _batch(a, b, args)
+    n = a.size
+    h = b-a
+    ends = _eval(f, np.stack([a, b], axis=1), args)
+    nfev = ends.size
+    previous = (h*(ends[:, 0]+ends[:, 1])/2)[:, None]
+    result = previous[:, 0].copy()
+    error = np.full(n, np.inf)
+    active = np.arange(n)
+    smallBefore = np.zeros(n, dtype=bool)
+    for k in range(1, maxLevel+1):
+        m = 2**(k-1)
+        hk = h[active]/m
+        fx = _eval(f, a[active, None]+hk[:, None]*(np.arange(m)+0.5), args, active)
+        nfev += fx.size
+        row = np.empty((active.size, k+1))
+        row[:, 0] = previous[:, 0]/2+hk/2*fx.sum(axis=1)
+        for j in range(1, k+1):
+            row[:, j] = row[:, j-1]+(row[:, j-1]-previous[:, j-1])/(4**j-1)
+        result[active] = row[:, k]
+        error[active] = np.abs(row[:, k]-previous[:, k-1])
+        # The tolerance must be met on two successive levels, and not before
+        # level 4, to avoid a spurious agreement when the integrand is aliased.
+        small = error[active] <= tol*np.maximum(1., np.abs(row[:, k]))
+        converged = small & smallBefore & (k >= 4)
+        active, previous, smallBefore = active[~converged], row[~converged], small[~converged]
+        if active.size == 0:
+            break
+    if full_output:
+        return result.reshape(shape), error.reshape(shape), nfev
+    return result.reshape(shape)
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# Headless runner for the simulations of this repository.
+#
+# Every simulation script exposes a run(...) function, whose keyword arguments
+# are the parameters of the simulation, and accepts a PhaseTimers object (see
+# profiling.py) timing its main phases. This runner calls it, either from the
+# command line:
+#     python runner.py lbm --set maxIter=1000 --set Re=220
+# or from a JSON configuration file describing one run or a batch of runs:
+#     python runner.py --config configs/small_batch.json
+#     {"runs": [{"simulation": "lbm", "params": {"maxIter": 1000}}, ...]}
+# By default the simulations run headless (no plots, Agg backend); add --plot
+# to get their usual output. --profile writes cProfile statistics and --sample
+# the collapsed stacks of a sampling profiler, for each run.
+
+import argparse, cProfile, importlib, json, os, pstats, time
+
+from profiling import PhaseTimers, SamplingProfiler
+
+# Name of the simulation -> module providing run().
+simulations = {
+    'lbm':            'lbmFlowAroundCylinder',
+    'barnes_hut':     'barnes_hut',
+    'barnes_hut_3D':  'barnes_hut_3D',
+    'traffic':        'trafficLights',
+    'bacteria':       'bacteria',
+    'parity':         'parityRule.parityRule',
+    'lotka_volterra': 'lotkaVolterra',
+    'stochastic_lotka_volterra': 'stochasticLotkaVolterra',
+    'piles':          'piles',
+}
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def numbered(filename, i, n):
+    # Output file of the i-th of n runs.
+    if filename is None or n == 1:
+        return filename
+    root, ext = os.path.splitext(filename)
+    return "{0}.{1}{2}".format(root, i, ext)
+
+def run_one(simulation, params, plot=False, profile=None, sample=None,
+            sample_interval=0.005):
+    """Runs one simulation and returns a dictionary with its wall-clock time
+    and its per-phase timers."""
+    if simulation not in simulations:
+        raise ValueError("Unknown simulation {0}, choose among {1}".format(
+                         simulation, ", ".join(sorted(simulations))))
+    module = importlib.import_module(simulations[simulation])
+    timers = PhaseTimers()
+    kwargs = dict(params, plot=plot, timers=timers)
+
+    profiler = cProfile.Profile() if profile else None
+    sampler = SamplingProfiler(sample_interval) if sample else None
+    start = time.perf_counter()
+    if sampler:
+        sampler.__enter__()
+    if profiler:
+        profiler.enable()
+    try:
+        module.run(**kwargs)
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.__exit__(None, None, None)
+    wall = time.perf_counter() - start
+
+    if profiler:
+        profiler.dump_stats(profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+    if sampler:
+        sampler.write(sample)
+    return {'simulation': simulation, 'params': params, 'wall': wall,
+            'phases': timers.as_dict(), 'report': timers.report()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the simulations headless, with per-phase timers.")
+    parser.add_argument('simulation', nargs='?', choices=sorted(simulations),
+                        help="simulation to run (or use --config)")
+    parser.add_argument('--config', help="JSON file with one run or a list of runs")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help="parameter of run(), VALUE being parsed as JSON when possible")
+    parser.add_argument('--plot', action='store_true', help="produce the usual plots and images")
+    parser.add_argument('--profile', metavar='FILE', help="write cProfile statistics to FILE")
+    parser.add_argument('--sample', metavar='FILE', help="write sampled collapsed stacks to FILE")
+    parser.add_argument('--sample-interval', type=float, default=0.005, metavar='SECONDS')
+    parser.add_argument('--report', metavar='FILE', help="write the timings of all runs as JSON to FILE")
+    args = parser.parse_args(argv)
+
+    if not args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+
+    runs = []
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+        runs = config['runs'] if 'runs' in config else [config]
+    if args.simulation:
+        runs.append({'simulation': args.simulation, 'params': {}})
+    if not runs:
+        parser.error("give a simulation or a --config file")
+    overrides = dict((name, parse_value(value)) for name, value in
+                     (item.split('=', 1) for item in args.set))
+
+    results = []
+    for i, run in enumerate(runs):
+        params = dict(run.get('params', {}), **overrides)
+        print("=== {0} {1}".format(run['simulation'], json.dumps(params)))
+        result = run_one(run['simulation'], params, args.plot,
+                         numbered(args.profile, i, len(runs)),
+                         numbered(args.sample, i, len(runs)), args.sample_interval)
+        print(result['report'])
+        print("wall time: {0:.3f} s".format(result['wall']))
+        results.append(result)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
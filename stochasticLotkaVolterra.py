@@ -0,0 +1,316 @@
+# Stochastic Lotka--Volterra dynamics for small populations.
+#
+# The antelopes a and cheetahs c are numbers of individuals, in a habitat of
+# size volume, and evolve by four reactions with the rates of the
+# deterministic model of lotkaVolterra.py:
+#     a -> 2a          propensity k_a*a
+#     a + c -> c       propensity k_ca*a*c/volume
+#     c -> 0           propensity k_c*c
+#     a + c -> a + 2c  propensity k_ac*a*c/volume
+# so that a/volume and c/volume follow LotkaVolterra when volume is large.
+#
+# Trajectories are simulated with the exact stochastic simulation algorithm
+# of Gillespie (SSA), or with adaptive tau-leaping (step size selection of
+# Cao, Gillespie and Petzold 2006, midpoint propensities), which fires many
+# reactions per step when the populations are large and falls back to SSA
+# steps when they are small. A batch of trajectories is advanced at once with
+# NumPy, each with its own clock.
+#
+# When one species dies out, the other one evolves alone and exactly: the
+# antelopes as a pure birth (Yule) process, the cheetahs as a pure death
+# process. This part of the trajectories is sampled from its known laws,
+# instead of simulating the exponential growth of the antelopes event by
+# event.
+#
+# The batches run in a process pool, and only their statistics (mean,
+# variance and extinctions) are sent back and merged, so that ensembles of
+# 10**5 trajectories stream in constant memory.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import matplotlib.pyplot as plt
+
+from lotkaVolterra import LotkaVolterra, RK2, Integrator
+from profiling import timers_or_none
+
+class StochasticLotkaVolterra(LotkaVolterra):
+    """This class defines the stochastic Lotka--Volterra
+    system of a habitat of size volume. Called, it is the
+    deterministic (mean-field) model of the densities.
+
+    Attributes:
+        volume    size of the habitat: populations are volume times the densities
+    """
+    # Change of (a, c) by each reaction.
+    stoichiometry = np.array([[1, 0], [-1, 0], [0, -1], [0, 1]])
+
+    def __init__(self,k_a,k_ca,k_c,k_ac,volume=100):
+        LotkaVolterra.__init__(self,k_a,k_ca,k_c,k_ac)
+        self.volume = volume
+
+    def propensities(self,a,c):
+        ac = a*c/self.volume
+        return np.array([self.k_a*a, self.k_ca*ac, self.k_c*c, self.k_ac*ac])
+
+def firstExtinctionSpecies(a,c):
+    # 0 if the antelopes died out, 1 if the cheetahs did (or both).
+    return np.where(a == 0, 0, 1)
+
+def simulateBatch(model, x0, times, n, method='ssa', seed=None, eps=0.03):
+    """Simulates n trajectories from the populations x0,
+    and returns their statistics (EnsembleStatistics) on the
+    time grid times. method is 'ssa' or 'tau' (tau-leaping,
+    with the error control parameter eps).
+    """
+    rng = np.random.default_rng(seed)
+    times = np.asarray(times, dtype=float)
+    nT = times.size
+    v = model.stoichiometry
+    out = np.empty((n, nT, 2))
+    # State of the trajectories still simulated, and their index in out.
+    ids = np.arange(n)
+    x = np.tile(np.asarray(x0, dtype=float), (n, 1))
+    t = np.full(n, times[0])
+    nextIdx = np.zeros(n, dtype=int)
+    # Trajectories stopped at the first extinction.
+    extinctIds, extinctTimes, extinctStates = [], [], []
+
+    def fill(mask, tNew, state):
+        # Grid points before tNew take the state.
+        while True:
+            m = mask & (nextIdx < nT)
+            m[m] = times[nextIdx[m]] < tNew[m]
+            if not m.any():
+                return
+            out[ids[m], nextIdx[m]] = state[m]
+            nextIdx[m] += 1
+
+    while ids.size > 0:
+        props = model.propensities(x[:, 0], x[:, 1])
+        a0 = props.sum(axis=0)
+        # Absorbed trajectories, where no reaction can fire (e.g. at (0, 0)),
+        # keep their state: the extinct ones are handed over to the exact
+        # evolution below, the others are filled in up to the last time.
+        absorbed = a0 == 0
+        if absorbed.any():
+            extinct = absorbed & (x == 0).any(axis=1)
+            fill(absorbed & ~extinct, np.full(ids.size, np.inf), x)
+            extinctIds.append(ids[extinct])
+            extinctTimes.append(t[extinct])
+            extinctStates.append(x[extinct])
+            keep = ~absorbed
+            ids, x, t, nextIdx = ids[keep], x[keep], t[keep], nextIdx[keep]
+            continue
+        xNew = x.copy()
+        tNew = np.empty_like(t)
+        if method == 'tau':
+            # Largest step such that the propensities change by less than a
+            # fraction eps (all reactions being at most of order 2).
+            mu = v.T.dot(props)
+            sigma2 = (v**2).T.dot(props)
+            bound = np.maximum(eps*x.T/2, 1)
+            with np.errstate(divide='ignore'):
+                tau = np.minimum(bound/np.abs(mu), bound**2/sigma2).min(axis=0)
+            # Leaps stop at the next grid time.
+            tau = np.minimum(tau, times[np.minimum(nextIdx, nT-1)] - t)
+            leap = (tau > 10/a0) & (nextIdx < nT)
+        else:
+            leap = np.zeros(ids.size, dtype=bool)
+        ssa = ~leap
+        if ssa.any():
+            # Exact step: time to the next reaction and which one fires.
+            tNew[ssa] = t[ssa] + rng.exponential(1/a0[ssa])
+            r = rng.random(ssa.sum())*a0[ssa]
+            j = (np.cumsum(props[:, ssa], axis=0) < r).sum(axis=0)
+            xNew[ssa] += v[np.minimum(j, 3)]
+        if leap.any():
+            # Poisson numbers of firings, with the propensities at the
+            # estimated midpoint of the step (second order in the mean); the
+            # step is halved where a population would become negative.
+            pending = np.flatnonzero(leap)
+            while pending.size > 0:
+                half = np.maximum(x[pending] + 0.5*tau[pending, None]*mu[:, pending].T, 0)
+                k = rng.poisson(model.propensities(half[:, 0], half[:, 1])*tau[pending])
+                trial = x[pending] + k.T.dot(v)
+                negative = (trial < 0).any(axis=1)
+                xNew[pending[~negative]] = trial[~negative]
+                tNew[pending[~negative]] = t[pending[~negative]] + tau[pending[~negative]]
+                pending = pending[negative]
+                tau[pending] /= 2
+        fill(np.ones(ids.size, dtype=bool), tNew, x)
+        # A leap ending on a grid time gives the state there.
+        m = leap & (nextIdx < nT)
+        m[m] = times[nextIdx[m]] == tNew[m]
+        out[ids[m], nextIdx[m]] = xNew[m]
+        nextIdx[m] += 1
+        x, t = xNew, tNew
+
+        extinct = (x == 0).any(axis=1) & (nextIdx < nT)
+        done = extinct | (nextIdx >= nT)
+        if done.any():
+            extinctIds.append(ids[extinct])
+            extinctTimes.append(t[extinct])
+            extinctStates.append(x[extinct])
+            keep = ~done
+            ids, x, t, nextIdx = ids[keep], x[keep], t[keep], nextIdx[keep]
+
+    ids = np.concatenate(extinctIds) if extinctIds else np.zeros(0, dtype=int)
+    te = np.concatenate(extinctTimes) if extinctTimes else np.zeros(0)
+    x = np.concatenate(extinctStates) if extinctStates else np.zeros((0, 2))
+    first = firstExtinctionSpecies(x[:, 0], x[:, 1])
+    # Exact evolution of the surviving species, from grid time to grid time.
+    t = te.copy()
+    for k in range(nT):
+        m = times[k] >= te
+        if not m.any():
+            continue
+        dt = times[k] - t[m]
+        a, c = x[m, 0], x[m, 1]
+        # Yule process: a(t+dt) - a(t) is negative binomial, a Poisson
+        # mixture over a Gamma law (kept continuous when it is huge).
+        p = np.exp(-model.k_a*dt)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lam = rng.gamma(np.maximum(a, 1), np.where(p > 0, (1-p)/p, np.inf))
+        lam = np.where(a > 0, lam, 0.)
+        births = np.where(lam < 1e12, rng.poisson(np.minimum(lam, 1e12)), lam)
+        a = a + births
+        c = rng.binomial(c.astype(np.int64), np.exp(-model.k_c*dt))
+        x[m, 0], x[m, 1] = a, c
+        t[m] = times[k]
+        out[ids[m], k] = x[m]
+
+    stats = EnsembleStatistics(times)
+    stats.count = n
+    stats.mean = out.mean(axis=0)
+    stats.m2 = ((out - stats.mean)**2).sum(axis=0)
+    stats.coexisting = n - (te[:, None] <= times[None, :]).sum(axis=0)
+    stats.extinctions = np.bincount(first, minlength=2)
+    if te.size > 0:
+        stats.extinctionMean = te.mean()
+        stats.extinctionM2 = ((te - te.mean())**2).sum()
+    return stats
+
+class EnsembleStatistics:
+    """This class defines the running statistics of an
+    ensemble of trajectories on a time grid, merged batch
+    after batch (Chan et al. update of the mean and of the
+    sum of squared deviations m2).
+
+    Attributes:
+        count         number of trajectories
+        mean, m2      mean and m2 of (a, c), of shape (len(times), 2)
+        coexisting    number of trajectories with both species alive, per time
+        extinctions   number of first extinctions of (antelopes, cheetahs)
+        extinctionMean, extinctionM2    moments of the first extinction times
+    """
+    def __init__(self, times):
+        self.times = np.asarray(times, dtype=float)
+        self.count = 0
+        self.mean = np.zeros((self.times.size, 2))
+        self.m2 = np.zeros((self.times.size, 2))
+        self.coexisting = np.zeros(self.times.size, dtype=int)
+        self.extinctions = np.zeros(2, dtype=int)
+        self.extinctionMean = 0.
+        self.extinctionM2 = 0.
+
+    @staticmethod
+    def combine(n1, mean1, m21, n2, mean2, m22):
+        n = n1 + n2
+        if n == 0:
+            return mean1, m21
+        delta = mean2 - mean1
+        return mean1 + delta*n2/n, m21 + m22 + delta**2*n1*n2/n
+
+    def merge(self, other):
+        n1, n2 = self.extinctions.sum(), other.extinctions.sum()
+        self.extinctionMean, self.extinctionM2 = self.combine(
+            n1, self.extinctionMean, self.extinctionM2,
+            n2, other.extinctionMean, other.extinctionM2)
+        self.mean, self.m2 = self.combine(self.count, self.mean, self.m2,
+                                          other.count, other.mean, other.m2)
+        self.count += other.count
+        self.coexisting = self.coexisting + other.coexisting
+        self.extinctions = self.extinctions + other.extinctions
+        return self
+
+    def variance(self):
+        return self.m2/max(self.count-1, 1)
+
+    def extinctionVariance(self):
+        return self.extinctionM2/max(self.extinctions.sum()-1, 1)
+
+    def __str__(self):
+        extinct = self.extinctions.sum()
+        text = "{0} trajectories, {1} with an extinction before t={2:g}".format(
+               self.count, extinct, self.times[-1])
+        if extinct > 0:
+            text += " ({0} antelopes, {1} cheetahs first), extinction time {2:.4g} +- {3:.4g}".format(
+                    self.extinctions[0], self.extinctions[1], self.extinctionMean,
+                    np.sqrt(self.extinctionVariance()))
+        return text
+
+def streamEnsemble(model, x0, times, trajectories, method='ssa', batch=1000,
+                   workers=None, seed=0, eps=0.03):
+    """Simulates the trajectories by batches, in a process
+    pool (workers processes, None: number of CPUs, 1:
+    sequential), and yields the statistics of all the
+    batches completed so far after each of them.
+    """
+    sizes = [min(batch, trajectories - start) for start in range(0, trajectories, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    stats = EnsembleStatistics(times)
+    if workers == 1 or len(sizes) <= 1:
+        for size, s in zip(sizes, seeds):
+            yield stats.merge(simulateBatch(model, x0, times, size, method, s, eps))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(simulateBatch, model, x0, times, size, method, s, eps)
+                       for size, s in zip(sizes, seeds)]
+            for f in as_completed(futures):
+                yield stats.merge(f.result())
+
+def simulateEnsemble(*args, **kwargs):
+    """Final statistics of streamEnsemble."""
+    for stats in streamEnsemble(*args, **kwargs):
+        pass
+    return stats
+
+def run(k_a=1,k_ca=1,k_c=0.5,k_ac=0.5,x0=(2,4),volume=20,tmax=30,N=301,
+        trajectories=10000,method='tau',batch=1000,workers=None,seed=0,
+        plot=True,timers=None):
+    timers = timers_or_none(timers)
+    model = StochasticLotkaVolterra(k_a,k_ca,k_c,k_ac,volume)
+    times = np.linspace(0,tmax,N)
+    populations = np.round(np.array(x0)*volume)
+
+    with timers.phase('ensemble'):
+        for stats in streamEnsemble(model,populations,times,trajectories,method,
+                                    batch,workers,seed):
+            if plot:
+                print(stats)
+    if not plot:
+        print(stats)
+
+    if plot:
+        # Ensemble mean and standard deviation of the densities, compared with
+        # the deterministic model.
+        deterministic = Integrator(RK2(model),np.array(x0,dtype=float),0,tmax,10*(N-1)+1)
+        sol = deterministic.integrate()
+        std = np.sqrt(stats.variance())
+        for i,(name,color) in enumerate((("antelope",'r'),("cheetah",'b'))):
+            plt.plot(times,stats.mean[:,i]/volume,color+'-',label=name+" (mean)")
+            plt.fill_between(times,(stats.mean[:,i]-std[:,i])/volume,
+                             (stats.mean[:,i]+std[:,i])/volume,color=color,alpha=0.2)
+            plt.plot(deterministic.getIntegrationTime(),sol[:,i],color+'--',
+                     label=name+" (deterministic)")
+        plt.xlabel('t')
+        plt.legend()
+        plt.show()
+        plt.plot(times,stats.coexisting/stats.count)
+        plt.xlabel('t')
+        plt.ylabel('fraction of coexisting populations')
+        plt.show()
+    return stats
+
+if __name__ == '__main__':
+    run()
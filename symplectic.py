@@ -0,0 +1,102 @@
+# Symplectic splitting integrators shared by the ODE scripts (lotkaVolterra.py)
+# and the N-body scripts (barnes_hut.py, barnes_hut_3D.py).
+#
+# A scheme is a sequence of the two exactly solvable sub-flows of a separable
+# system, the "drift" (positions move with fixed momenta) and the "kick"
+# (momenta change with fixed positions). A system plugs in by providing
+#     system.drift(x, h) and system.kick(x, h),
+# both returning the advanced state x. The schemes have the iterate(x, t, dt)
+# method of the schemes of lotkaVolterra.py and can be used with its Integrator.
+
+import numpy as np
+
+def composition(weights):
+    """Returns the flow sequence of the composition of leapfrog
+    (kick-drift-kick) steps of sizes weights[i]*dt. Consecutive kicks
+    are merged, so that a composition of n leapfrog steps costs n+1
+    kicks, and only n if the last kick is reused by the next step.
+    """
+    sequence = []
+    for w in weights:
+        for flow, c in (('kick', w/2), ('drift', w), ('kick', w/2)):
+            if sequence and sequence[-1][0] == flow:
+                sequence[-1] = (flow, sequence[-1][1]+c)
+            else:
+                sequence.append((flow, c))
+    return sequence
+
+class Splitting:
+    """This class defines a splitting scheme for a separable
+    system as a sequence of (flow, coefficient) pairs, where flow
+    is 'kick' or 'drift' and the coefficient multiplies dt.
+    """
+    sequence = None
+    order = None
+
+    def __init__(self, system):
+        self.system = system
+
+    def iterate(self, x0, t, dt):
+        x = x0
+        for flow, c in self.sequence:
+            x = getattr(self.system, flow)(x, c*dt)
+        return x
+
+class SymplecticEuler(Splitting):
+    """Symplectic Euler scheme of order 1: kick, then drift."""
+    order = 1
+    sequence = [('kick', 1.), ('drift', 1.)]
+
+class Leapfrog(Splitting):
+    """Leapfrog / velocity Verlet scheme of order 2: kick-drift-kick."""
+    order = 2
+    sequence = composition([1.])
+
+class Yoshida4(Splitting):
+    """Yoshida (Forest-Ruth) scheme of order 4: composition
+    of three leapfrog steps, the middle one going backwards in time.
+    """
+    order = 4
+    w1 = 1/(2-2**(1/3))
+    w0 = 1-2*w1
+    sequence = composition([w1, w0, w1])
+
+class Yoshida6(Splitting):
+    """Yoshida scheme of order 6 (solution A): composition
+    of seven leapfrog steps.
+    """
+    order = 6
+    w1, w2, w3 = -1.17767998417887, 0.235573213359357, 0.784513610477560
+    w0 = 1-2*(w1+w2+w3)
+    sequence = composition([w3, w2, w1, w0, w1, w2, w3])
+
+class InvariantMonitor:
+    """This class records a quantity that should be conserved
+    by the dynamics (energy, first integral) along a run and
+    measures its relative drift with respect to the initial value.
+
+    Attributes:
+        invariant   function of the state returning the conserved quantity
+        times       times at which the quantity was recorded
+        values      recorded values
+    """
+    def __init__(self, invariant):
+        self.invariant = invariant
+        self.times = []
+        self.values = []
+
+    def record(self, t, x):
+        self.times.append(t)
+        self.values.append(self.invariant(x))
+        return self.values[-1]
+
+    def relativeError(self):
+        values = np.array(self.values)
+        return np.abs(values-values[0])/np.maximum(np.abs(values[0]), 1e-300)
+
+    def drift(self):
+        """Maximum relative deviation from the initial value."""
+        return float(np.max(self.relativeError()))
+
+    def __str__(self):
+        return "invariant drift = {0:.3e} over {1} samples".format(self.drift(), len(self.values))
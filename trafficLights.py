@@ -3,13 +3,18 @@
 
 from heapq import *
 from numpy import random
+from profiling import timers_or_none
+from eventTrace import TraceWriter
 
 ### STATE ##########################################
 
 class State:
-    def __init__(self):
+    def __init__(self, Tc=None, Tp=None):
         self.green = False
         self.cars = 0
+        # Time latency and passage time, by default the values of Tc and Tp below.
+        self.Tc = Tc
+        self.Tp = Tp
     def is_green(self):
         """
         True if the light is green
@@ -79,14 +84,14 @@ class CAR(Event):
             state.add_car()
             if state.waiting_cars() == 1:
                 # On the line 79, insert into the queue a R2G event at the time (self.t + Tc)
-                queue.insert(R2G(self.t + Tc))
+                queue.insert(R2G(self.t + (Tc if state.Tc is None else state.Tc)))
 
 class R2G(Event):
     def __init__(self,time):
         self.t = time
         self.name = "R2G"
     def action(self,queue,state):
-        queue.insert( G2R( self.t + state.waiting_cars() * Tp) )
+        queue.insert( G2R( self.t + state.waiting_cars() * (Tp if state.Tp is None else state.Tp)) )
         # On the line 87, change the state and turn the light to green
         state.turn_green()
         state.purge_cars()
@@ -125,30 +130,56 @@ class EventQueue:
       """
       return heappop( self.q )
 
-### MAIN #####################################################
+### TRACE ##################################################
 
-Q = EventQueue()
-
-Q.insert( CAR(10) ) 
-Q.insert( CAR(25) )
-Q.insert( CAR(35) )
-Q.insert( CAR(60) )
-Q.insert( CAR(75) )
-
-# To answer the second part of this project, uncomment the following lines 134 to 139 and change the passage time to 15 seconds (at line 52).
-random.seed(1)
-additionalNumCarInQueue=100
-tRandom = 80
-for i in range(1, additionalNumCarInQueue):
-    tRandom = random.randint(tRandom+1, tRandom+10)
-    Q.insert( CAR(tRandom) )  
-    
+# Columns of the event traces: type code, time, and change of the number of
+# waiting cars and of the light (+1 turned green, -1 turned red).
+eventTypes = ['CAR', 'R2G', 'G2R']
+eventCodes = dict((name, code) for code, name in enumerate(eventTypes))
+traceColumns = [('code', 'B'), ('time', 'd'), ('dcars', 'i'), ('dgreen', 'b')]
 
-S = State()
+### MAIN #####################################################
 
-# Processing events until the queue is Q is empty
-while Q.notEmpty():
-    e = Q.next()
-    print( e )
-    e.action(Q,S)
+def run(Tc=Tc, Tp=Tp, additionalNumCarInQueue=100, seed=1, plot=True, trace=None,
+        timers=None):
+    # The output of this simulation, made when plot is True, is the list of the
+    # processed events. They are also recorded in the event log trace (a file
+    # name) if given, to be queried with eventTrace.py.
+    timers = timers_or_none(timers)
+    Q = EventQueue()
+
+    Q.insert( CAR(10) ) 
+    Q.insert( CAR(25) )
+    Q.insert( CAR(35) )
+    Q.insert( CAR(60) )
+    Q.insert( CAR(75) )
+
+    # To answer the second part of this project, uncomment the following lines 134 to 139 and change the passage time to 15 seconds (at line 52).
+    random.seed(seed)
+    tRandom = 80
+    for i in range(1, additionalNumCarInQueue):
+        tRandom = random.randint(tRandom+1, tRandom+10)
+        Q.insert( CAR(tRandom) )  
+    
 
+    S = State(Tc, Tp)
+
+    # Processing events until the queue is Q is empty
+    events = 0
+    writer = TraceWriter(trace, traceColumns, eventTypes) if trace else None
+    with timers.phase('event dispatch'):
+        while Q.notEmpty():
+            e = Q.next()
+            if plot:
+                print( e )
+            cars, green = S.cars, S.green
+            e.action(Q,S)
+            if writer:
+                writer.record(eventCodes[e.name], e.t, S.cars - cars, S.green - green)
+            events += 1
+    if writer:
+        writer.close()
+    return S, events
+
+if __name__ == '__main__':
+    run()